@@ -1,11 +1,16 @@
 import gspread
 from google.oauth2.service_account import Credentials
 import os
+import json
+import hashlib
 import re
 from datetime import datetime
 from dotenv import load_dotenv
 from PIL import Image, ImageDraw, ImageFont
-import textwrap
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import image_encoders
 
 def extract_spreadsheet_id_from_url():
     """
@@ -44,98 +49,169 @@ def get_project_name():
             return name
         print('Ошибка: название проекта не может быть пустым.')
 
-def calculate_font_size(text1, text2, text3):
+# Шрифты, которые пробуем по порядку; если ни один не найден — стандартный шрифт Pillow
+FONT_CANDIDATES = [
+    "/System/Library/Fonts/Arial.ttf",
+    "/System/Library/Fonts/Helvetica.ttc",
+]
+
+# Размер, при котором измеряется ширина символов; для других размеров она масштабируется
+REFERENCE_FONT_SIZE = 100
+
+# Границы подбора размера шрифта
+MIN_FONT_SIZE = 12
+MAX_FONT_SIZE = 60
+
+# Размер и поля изображения
+IMAGE_WIDTH, IMAGE_HEIGHT = 1920, 1080
+MARGIN = 100
+LINE_SPACING = 1.2
+
+# Версия отрисовки: увеличивается при изменении внешнего вида изображений,
+# чтобы при следующем запуске все изображения были созданы заново
+RENDER_VERSION = 2
+
+# Файл со снимком содержимого строк, для которых уже созданы изображения
+MANIFEST_FILENAME = 'placeholders_manifest.json'
+
+# Ширина символов для каждого шрифта: {путь к шрифту: {символ: ширина}}
+_glyph_widths = {}
+
+@lru_cache(maxsize=None)
+def find_font_path():
+    """Возвращает путь к первому доступному шрифту или None"""
+    for font_path in FONT_CANDIDATES:
+        try:
+            ImageFont.truetype(font_path, MIN_FONT_SIZE)
+            return font_path
+        except OSError:
+            continue
+    return None
+
+@lru_cache(maxsize=128)
+def load_font(font_path, font_size):
+    """Загружает шрифт; объекты шрифтов кэшируются по (путь, размер)"""
+    if font_path is None:
+        try:
+            return ImageFont.load_default(font_size)
+        except TypeError:
+            # Старые версии Pillow не умеют масштабировать стандартный шрифт
+            return ImageFont.load_default()
+    return ImageFont.truetype(font_path, font_size)
+
+def measure_text(text, font_path, font_size):
+    """Вычисляет ширину строки по таблице ширины символов шрифта"""
+    widths = _glyph_widths.setdefault(font_path, {})
+    total = 0.0
+    for char in text:
+        width = widths.get(char)
+        if width is None:
+            width = load_font(font_path, REFERENCE_FONT_SIZE).getlength(char)
+            widths[char] = width
+        total += width
+    return total * font_size / REFERENCE_FONT_SIZE
+
+def wrap_paragraph(text, font_path, font_size, max_width):
+    """
+    Переносит абзац по словам так, чтобы строки помещались в max_width.
+    Возвращает (строки, помещается ли каждое слово целиком).
+    """
+    space_width = measure_text(' ', font_path, font_size)
+    lines = []
+    current_line = ''
+    current_width = 0.0
+    fits = True
+    
+    for word in text.split():
+        word_width = measure_text(word, font_path, font_size)
+        if word_width > max_width:
+            fits = False
+        
+        if current_line and current_width + space_width + word_width <= max_width:
+            current_line += ' ' + word
+            current_width += space_width + word_width
+        else:
+            if current_line:
+                lines.append(current_line)
+            current_line = word
+            current_width = word_width
+    
+    if current_line:
+        lines.append(current_line)
+    return lines, fits
+
+def layout_text(texts, font_path, font_size, max_width, max_height):
+    """Раскладывает абзацы по строкам и проверяет, помещается ли текст на изображение"""
+    paragraphs = []
+    fits = True
+    for text in texts:
+        if text and text.strip():
+            lines, paragraph_fits = wrap_paragraph(text.strip(), font_path, font_size, max_width)
+            paragraphs.append(lines)
+            fits = fits and paragraph_fits
+    
+    line_spacing = font_size * LINE_SPACING
+    total_lines = sum(len(lines) for lines in paragraphs)
+    total_height = total_lines * line_spacing + max(len(paragraphs) - 1, 0) * line_spacing * 0.5
+    return fits and total_height <= max_height, paragraphs
+
+def fit_text_layout(texts, font_path):
     """
-    Рассчитывает оптимальный размер шрифта исходя из объема текста
+    Подбирает двоичным поиском наибольший размер шрифта, при котором
+    текст целиком помещается на изображение. Возвращает (размер, абзацы).
     """
-    # Объединяем весь текст
-    all_text = f"{text1} {text2} {text3}".strip()
-    
-    if not all_text:
-        return 50  # Размер по умолчанию для пустого текста
-    
-    # Подсчитываем общее количество символов
-    total_chars = len(all_text)
-    
-    # Базовые размеры для разных объемов текста
-    if total_chars <= 100:
-        return 60
-    elif total_chars <= 300:
-        return 50
-    elif total_chars <= 600:
-        return 40
-    elif total_chars <= 1000:
-        return 35
-    elif total_chars <= 1500:
-        return 30
-    elif total_chars <= 2500:
-        return 25
-    else:
-        return 20  # Минимальный размер для очень длинного текста
+    max_width = IMAGE_WIDTH - 2 * MARGIN
+    max_height = IMAGE_HEIGHT - 2 * MARGIN
+    
+    best = None
+    low, high = MIN_FONT_SIZE, MAX_FONT_SIZE
+    while low <= high:
+        font_size = (low + high) // 2
+        fits, paragraphs = layout_text(texts, font_path, font_size, max_width, max_height)
+        if fits:
+            best = (font_size, paragraphs)
+            low = font_size + 1
+        else:
+            high = font_size - 1
+    
+    if best is None:
+        # Текст не помещается даже при минимальном размере — используем минимальный
+        _, paragraphs = layout_text(texts, font_path, MIN_FONT_SIZE, max_width, max_height)
+        best = (MIN_FONT_SIZE, paragraphs)
+    return best
 
-def create_text_image(text1, text2, text3, output_path):
+def create_text_image(text1, text2, text3, output_path, encoder_settings=None):
     """
-    Создает изображение 1920x1080 с тремя абзацами текста
+    Создает изображение 1920x1080 с тремя абзацами текста.
+    Формат файла задается encoder_settings (по умолчанию — из переменных окружения).
     """
-    # Рассчитываем оптимальный размер шрифта
-    font_size = calculate_font_size(text1, text2, text3)
+    # Подбираем размер шрифта по фактической ширине текста
+    font_path = find_font_path()
+    font_size, paragraphs = fit_text_layout([text1, text2, text3], font_path)
+    font = load_font(font_path, font_size)
     
     # Создаем изображение
-    width, height = 1920, 1080
-    image = Image.new('RGB', (width, height), color='white')
+    image = Image.new('RGB', (IMAGE_WIDTH, IMAGE_HEIGHT), color='white')
     draw = ImageDraw.Draw(image)
     
-    # Пытаемся загрузить шрифт, если не получается - используем стандартный
-    try:
-        # Попытка загрузить системный шрифт
-        font = ImageFont.truetype("/System/Library/Fonts/Arial.ttf", font_size)
-    except:
-        try:
-            # Попытка загрузить другой системный шрифт
-            font = ImageFont.truetype("/System/Library/Fonts/Helvetica.ttc", font_size)
-        except:
-            # Используем стандартный шрифт
-            font = ImageFont.load_default()
-    
     # Настройки текста
     text_color = (0, 0, 0)  # Черный цвет
-    line_spacing = font_size * 1.2
-    margin = 100
-    max_width = width - 2 * margin
-    
-    # Функция для обертывания текста
-    def wrap_text(text, max_width):
-        if not text:
-            return []
-        # Примерное количество символов в строке
-        chars_per_line = max_width // (font_size // 2)
-        return textwrap.wrap(text, width=chars_per_line, break_long_words=False, break_on_hyphens=False)
-    
-    # Обрабатываем каждый абзац
-    texts = [text1, text2, text3]
-    current_y = margin
-    
-    for i, text in enumerate(texts):
-        if text and text.strip():
-            # Обертываем текст
-            lines = wrap_text(text.strip(), max_width)
-            
-            # Рисуем каждую строку
-            for line in lines:
-                # Центрируем текст по горизонтали
-                bbox = draw.textbbox((0, 0), line, font=font)
-                text_width = bbox[2] - bbox[0]
-                x = (width - text_width) // 2
-                
-                draw.text((x, current_y), line, fill=text_color, font=font)
-                current_y += line_spacing
-            
-            # Добавляем отступ между абзацами
-            current_y += line_spacing * 0.5
+    line_spacing = font_size * LINE_SPACING
+    current_y = MARGIN
+    
+    for lines in paragraphs:
+        # Рисуем каждую строку, центрируя по горизонтали
+        for line in lines:
+            x = (IMAGE_WIDTH - measure_text(line, font_path, font_size)) // 2
+            draw.text((x, current_y), line, fill=text_color, font=font)
+            current_y += line_spacing
+        
+        # Добавляем отступ между абзацами
+        current_y += line_spacing * 0.5
     
     # Сохраняем изображение
-    image.save(output_path, 'JPEG', quality=95)
-    print(f"✓ Создано изображение: {output_path} (размер шрифта: {font_size})")
+    image_encoders.encode_image(image, output_path, encoder_settings or image_encoders.get_output_settings())
+    return font_size
 
 def read_table_data(spreadsheet_id):
     """
@@ -194,32 +270,151 @@ def read_table_data(spreadsheet_id):
     print(f"\n✓ Прочитано {len(rows_data)} строк с данными")
     return rows_data
 
-def create_images_from_data(rows_data, output_dir):
+def get_worker_count():
+    """
+    Количество процессов для создания изображений.
+    Задается переменной окружения PLACEHOLDER_WORKERS, по умолчанию — число ядер.
+    """
+    value = os.getenv('PLACEHOLDER_WORKERS', '').strip()
+    if value:
+        try:
+            return max(1, int(value))
+        except ValueError:
+            print(f"⚠️  Некорректное значение PLACEHOLDER_WORKERS={value}, использую число ядер")
+    return os.cpu_count() or 1
+
+def get_image_path(output_dir, row_number, encoder_settings):
+    """Путь к изображению строки с расширением выбранного формата"""
+    return os.path.join(output_dir, f"{row_number}{image_encoders.get_extension(encoder_settings)}")
+
+def remove_row_images(output_dir, row_number, keep_path=None):
+    """Удаляет изображения строки во всех форматах, кроме keep_path. Возвращает количество удаленных"""
+    removed = 0
+    for extension in set(image_encoders.FORMAT_EXTENSIONS.values()):
+        image_path = os.path.join(output_dir, f"{row_number}{extension}")
+        if image_path != keep_path and os.path.exists(image_path):
+            os.remove(image_path)
+            removed += 1
+    return removed
+
+def render_row(row_data, output_dir, encoder_settings):
+    """Создает изображение для одной строки таблицы (выполняется в отдельном процессе)"""
+    output_path = get_image_path(output_dir, row_data['row_number'], encoder_settings)
+    font_size = create_text_image(row_data['col_a'], row_data['col_b'], row_data['col_c'],
+                                  output_path, encoder_settings)
+    return output_path, font_size
+
+def get_row_hash(row_data, font_path, encoder_settings):
+    """Хэш всего, от чего зависит изображение строки"""
+    key = json.dumps([
+        row_data['col_a'], row_data['col_b'], row_data['col_c'],
+        font_path, IMAGE_WIDTH, IMAGE_HEIGHT, MIN_FONT_SIZE, MAX_FONT_SIZE, RENDER_VERSION,
+        encoder_settings
+    ], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def load_manifest(output_dir):
+    """Загружает снимок строк предыдущего запуска: {номер строки: хэш}"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️  Не удалось прочитать {MANIFEST_FILENAME}, все изображения будут созданы заново: {e}")
+        return {}
+
+def save_manifest(output_dir, manifest):
+    """Сохраняет снимок строк текущего запуска"""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+def create_images_from_data(rows_data, output_dir, workers=None):
     """
-    Создает изображения из данных таблицы
+    Создает изображения из данных таблицы.
+    Изображения создаются только для новых и измененных строк, а изображения
+    строк, исчезнувших из таблицы, удаляются. Строки обрабатываются
+    параллельно в нескольких процессах; каждое изображение зависит только
+    от своей строки, поэтому результат не зависит от количества процессов.
     """
     print(f"\n=== СОЗДАНИЕ ИЗОБРАЖЕНИЙ ===")
     
     # Создаем выходную директорию
     os.makedirs(output_dir, exist_ok=True)
     
+    # Сравниваем строки с прошлым запуском
+    previous_manifest = load_manifest(output_dir)
+    font_path = find_font_path()
+    encoder_settings = image_encoders.get_output_settings()
+    row_hashes = {
+        str(row_data['row_number']): get_row_hash(row_data, font_path, encoder_settings)
+        for row_data in rows_data
+    }
+    
+    rows_to_render = [
+        row_data for row_data in rows_data
+        if previous_manifest.get(str(row_data['row_number'])) != row_hashes[str(row_data['row_number'])]
+        or not os.path.exists(get_image_path(output_dir, row_data['row_number'], encoder_settings))
+    ]
+    
+    # Изображения перерисовываемых строк в прежнем формате больше не нужны
+    for row_data in rows_to_render:
+        remove_row_images(output_dir, row_data['row_number'],
+                          keep_path=get_image_path(output_dir, row_data['row_number'], encoder_settings))
+    
+    # Удаляем изображения строк, которых больше нет в таблице
+    removed_count = 0
+    for row_number in previous_manifest:
+        if row_number not in row_hashes and remove_row_images(output_dir, row_number):
+            removed_count += 1
+            print(f"✓ Удалено изображение исчезнувшей строки: {row_number}")
+    
+    unchanged_count = len(rows_data) - len(rows_to_render)
+    if unchanged_count:
+        print(f"Без изменений: {unchanged_count} строк")
+    
+    # В снимок попадают только строки, изображения которых действительно есть
+    manifest = {
+        row_number: row_hash for row_number, row_hash in row_hashes.items()
+        if previous_manifest.get(row_number) == row_hash
+    }
+    
+    workers = workers or get_worker_count()
+    total = len(rows_to_render)
     created_count = 0
+    print(f"Формат изображений: {encoder_settings['format']}")
     
-    for row_data in rows_data:
-        row_number = row_data['row_number']
-        col_a = row_data['col_a']
-        col_b = row_data['col_b']
-        col_c = row_data['col_c']
-        
-        # Создаем имя файла
-        filename = f"{row_number}.jpg"
-        output_path = os.path.join(output_dir, filename)
-        
-        # Создаем изображение
-        create_text_image(col_a, col_b, col_c, output_path)
-        created_count += 1
+    try:
+        if workers == 1 or total <= 1:
+            for row_data in rows_to_render:
+                output_path, font_size = render_row(row_data, output_dir, encoder_settings)
+                manifest[str(row_data['row_number'])] = row_hashes[str(row_data['row_number'])]
+                created_count += 1
+                print(f"[{created_count}/{total}] ✓ Создано изображение: {output_path} (размер шрифта: {font_size})")
+        else:
+            print(f"Процессов: {workers}")
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = {
+                    executor.submit(render_row, row_data, output_dir, encoder_settings): str(row_data['row_number'])
+                    for row_data in rows_to_render
+                }
+                
+                # Сообщаем о прогрессе по мере готовности изображений
+                for future in as_completed(futures):
+                    output_path, font_size = future.result()
+                    manifest[futures[future]] = row_hashes[futures[future]]
+                    created_count += 1
+                    print(f"[{created_count}/{total}] ✓ Создано изображение: {output_path} (размер шрифта: {font_size})")
+    finally:
+        save_manifest(output_dir, manifest)
     
     print(f"\n✓ Создано {created_count} изображений в директории: {output_dir}")
+    if removed_count:
+        print(f"✓ Удалено {removed_count} изображений исчезнувших строк")
     return created_count
 
 def main():
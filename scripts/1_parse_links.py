@@ -4,9 +4,42 @@ import os
 import re
 import urllib.parse
 import json
-import requests
+import hashlib
+import http_client
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+import url_cache
+from host_limiter import HostLimiter
+from link_files import sanitize_filename
+from url_classifier import classify_url
+from redirect_resolver import is_short_link, resolve_short_link
+from content_sniffer import SNIFF_BYTES, sniff_content_type, get_category_from_mime_type
+
+# Настройки параллельной проверки заголовков
+PROBE_MAX_WORKERS = 16  # Общее количество потоков для HEAD-запросов
+PROBE_PER_HOST_LIMIT = 4  # Максимум одновременных запросов к одному хосту
+
+GENERIC_CONTENT_TYPES = {'', 'application/octet-stream', 'binary/octet-stream', 'application/binary'}
+# Ответы, которые окончательно говорят, что файла нет (их можно кэшировать)
+MISSING_STATUSES = {404, 410}
+
+# Лист, который используется, если в диапазоне не указано название листа
+DEFAULT_WORKSHEET = 'Лист1'
+
+# Диапазон вида [Лист!]B[2][:D[100]]
+RANGE_SPEC_PATTERN = re.compile(r'^(?:(.+)!)?([A-Za-z]{1,3})(\d*)(?::([A-Za-z]{1,3})(\d*))?$')
+
+# Файл со снимком ячеек предыдущих запусков (для инкрементального обновления)
+MANIFEST_FILENAME = 'cells_manifest.json'
+MANIFEST_VERSION = 2
+
+# Ссылка на ячейку в имени: B12
+CELL_REF_PATTERN = re.compile(r'^([A-Z]+)(\d+)$')
+
+# Не больше PROBE_PER_HOST_LIMIT одновременных проверок одного хоста
+host_limiter = HostLimiter(PROBE_PER_HOST_LIMIT, 0)
 
 def extract_spreadsheet_id_from_url():
     """
@@ -38,12 +71,95 @@ def extract_spreadsheet_id_from_url():
             print("Убедитесь, что ссылка корректная и содержит ID таблицы.")
             print("Попробуйте снова.")
 
-def get_column_from_user():
+def column_letters_to_index(letters):
+    """Переводит буквенное обозначение колонки в номер (A -> 1, AA -> 27)"""
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - ord('A') + 1)
+    return index
+
+def column_index_to_letters(index):
+    """Переводит номер колонки в буквенное обозначение (1 -> A, 27 -> AA)"""
+    letters = ''
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+def quote_worksheet_name(name):
+    """Оформляет название листа для использования в диапазоне A1"""
+    return "'" + name.replace("'", "''") + "'"
+
+def normalize_worksheet_name(name):
+    """
+    Приводит название листа из ввода к одному виду: снимает кавычки ('Лист 2')
+    и возвращает None для листа по умолчанию, чтобы "Лист1!B" и "B" давали
+    одни и те же имена ячеек
+    """
+    name = name.strip()
+    if len(name) > 1 and name.startswith("'") and name.endswith("'"):
+        name = name[1:-1].replace("''", "'")
+    if not name or name.casefold() == DEFAULT_WORKSHEET.casefold():
+        return None
+    return name
+
+def get_name_prefix(worksheet):
+    """Префикс имен ячеек листа: название листа, пригодное для имени файла"""
+    return f"{sanitize_filename(worksheet)} " if worksheet else ''
+
+def parse_range_spec(spec):
+    """
+    Разбирает диапазон, введенный пользователем: B, AA, B:D, B2:D100, Лист2!C.
+    Возвращает (название листа или None, диапазон A1) или None, если формат неверный.
+    """
+    match = RANGE_SPEC_PATTERN.match(spec.strip())
+    if not match:
+        return None
+    
+    worksheet, start_col, start_row, end_col, end_row = match.groups()
+    start_col = start_col.upper()
+    end_col = (end_col or start_col).upper()
+    if column_letters_to_index(start_col) > column_letters_to_index(end_col):
+        return None
+    
+    a1_range = f"{start_col}{start_row}:{end_col}{end_row or ''}"
+    return (normalize_worksheet_name(worksheet) if worksheet else None), a1_range
+
+def parse_a1_bounds(a1_range):
+    """Возвращает (первая колонка, первая строка, последняя колонка, последняя строка); строки могут быть None"""
+    bounds = []
+    for cell in a1_range.split(':'):
+        match = re.match(r'([A-Z]+)(\d*)', cell)
+        bounds.append((column_letters_to_index(match.group(1)), int(match.group(2)) if match.group(2) else None))
+    (start_col, start_row), (end_col, end_row) = bounds
+    return start_col, start_row, end_col, end_row
+
+def is_cell_in_ranges(cell_key, ranges):
+    """Проверяет, попадает ли ячейка снимка ("Лист2 B12" или "B12") в один из диапазонов"""
+    for worksheet, a1_range in ranges:
+        name_prefix = get_name_prefix(worksheet)
+        if not cell_key.startswith(name_prefix):
+            continue
+        match = CELL_REF_PATTERN.match(cell_key[len(name_prefix):])
+        if not match:
+            continue
+        col = column_letters_to_index(match.group(1))
+        row = int(match.group(2))
+        start_col, start_row, end_col, end_row = parse_a1_bounds(a1_range)
+        if (start_col <= col <= end_col and (start_row is None or row >= start_row)
+                and (end_row is None or row <= end_row)):
+            return True
+    return False
+
+def get_ranges_from_user():
     while True:
-        col = input('Введите латинскую заголовную букву колонки таблицы (например, B): ').strip().upper()
-        if len(col) == 1 and 'A' <= col <= 'Z':
-            return col
-        print('Ошибка: введите одну латинскую заголовную букву (A-Z).')
+        print('Введите колонки или диапазоны через запятую.')
+        print('Примеры: B | B, D, AA | B2:D100 | Лист2!C')
+        specs = input(f'Диапазоны (без названия листа используется "{DEFAULT_WORKSHEET}"): ').split(',')
+        ranges = [parse_range_spec(spec) for spec in specs if spec.strip()]
+        if ranges and all(ranges):
+            return ranges
+        print('Ошибка: используйте латинские заглавные буквы колонок, например B, AA или B2:D100.')
 
 def get_project_name():
     while True:
@@ -52,104 +168,110 @@ def get_project_name():
             return name
         print('Ошибка: название проекта не может быть пустым.')
 
-def is_youtube_url(url):
-    """Проверяет, является ли ссылка YouTube ссылкой"""
-    return 'youtube.com' in url or 'youtu.be' in url
-
-def is_image_url(url):
-    """Проверяет, является ли ссылка ссылкой на изображение"""
-    # Проверяем домены изображений
-    image_domains = [
-        'images.app.goo.gl', 'avatars.mds.yandex.net', 'avatars.dzeninfra.ru',
-        'cdn.i.haymarketmedia.asia', 'images.steamusercontent.com', 'play-lh.googleusercontent.com',
-        'share.google'
-    ]
-    for domain in image_domains:
-        if domain in url:
-            return True
-    
-    # Проверяем расширения изображений
-    image_exts = ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tiff', '.svg']
-    if any(url.lower().split('?')[0].endswith(ext) for ext in image_exts):
-        return True
-    
-    # Проверяем параметры в URL, указывающие на изображения
-    image_params = ['scale_', 'resize', 'XXXL', 'diploma', 'thumbs']
-    for param in image_params:
-        if param in url:
-            return True
-    
-    return False
+def sniff_url_content_type(url):
+    """
+    Запрашивает только первые байты файла (Range) и определяет тип по сигнатуре.
+    Возвращает (MIME-тип или None, финальный URL, код ответа).
+    """
+    response = http_client.get(
+        url, timeout=10, stream=True,
+        headers={'Range': f'bytes=0-{SNIFF_BYTES - 1}'}
+    )
+    try:
+        if response.status_code not in (200, 206):
+            return None, response.url, response.status_code
+        
+        # Сервер может проигнорировать Range, поэтому читаем не больше SNIFF_BYTES
+        data = b''
+        for chunk in response.iter_content(chunk_size=SNIFF_BYTES):
+            data += chunk
+            if len(data) >= SNIFF_BYTES:
+                break
+        return sniff_content_type(data[:SNIFF_BYTES]), response.url, response.status_code
+    finally:
+        response.close()
 
-def is_video_url(url):
-    """Проверяет, является ли ссылка ссылкой на видео (кроме YouTube)"""
-    video_domains = [
-        'vimeo.com', 'vk.com/video', 'rutube.ru', 'dailymotion.com',
-        'tiktok.com', 'facebook.com', 'bilibili.com', 'ok.ru', 'dzen.ru', 'instagram.com'
-    ]
-    for domain in video_domains:
-        if domain in url:
-            return True
-    
-    # Проверяем домены Яндекс.Видео
-    if 'yandex.ru/video' in url:
-        return True
+def check_content_type_by_headers(url):
+    """
+    Проверяет тип контента по HTTP заголовкам.
+    Если HEAD не поддерживается или content-type ничего не говорит о типе,
+    определяет тип по первым байтам файла.
+    В кэш попадают только окончательные ответы: тип из ответа 200, результат
+    проверки первых байт или 404/410. После временных ошибок (429, 5xx,
+    таймауты) ссылка будет проверена заново при следующем запуске.
+    """
+    # Сначала смотрим в постоянный кэш, чтобы не обращаться к сети повторно
+    cached = url_cache.get_classification(url)
+    if cached:
+        return cached['category'] if cached['category'] != 'other' else None
     
-    # Проверяем расширения видео файлов
-    video_exts = ['.mp4', '.webm', '.mov', '.avi', '.mkv', '.flv', '.m4v', '.3gp']
-    if any(url.lower().split('?')[0].endswith(ext) for ext in video_exts):
-        return True
+    category = None
+    content_type = ''
+    final_url = url
+    definitive = False
     
-    return False
-
-def check_content_type_by_headers(url):
-    """Проверяет тип контента по HTTP заголовкам"""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        response = requests.head(url, headers=headers, timeout=10, allow_redirects=True)
+        response = http_client.head(url, timeout=10)
+        content_type = response.headers.get('content-type', '').lower()
+        final_url = response.url
         
         if response.status_code == 200:
-            content_type = response.headers.get('content-type', '').lower()
-            
             # Проверяем изображения
             if any(img_type in content_type for img_type in ['image/', 'image/jpeg', 'image/png', 'image/gif', 'image/webp']):
-                return 'image'
+                category = 'image'
             
             # Проверяем видео
-            if any(video_type in content_type for video_type in ['video/', 'video/mp4', 'video/webm', 'video/avi']):
-                return 'video'
+            elif any(video_type in content_type for video_type in ['video/', 'video/mp4', 'video/webm', 'video/avi']):
+                category = 'video'
+            
+            definitive = category is not None or content_type.split(';')[0].strip() not in GENERIC_CONTENT_TYPES
+        elif response.status_code in MISSING_STATUSES:
+            definitive = True
         
-        return None
+        needs_sniff = category is None and (
+            response.status_code in http_client.HEAD_UNSUPPORTED_STATUSES
+            or (response.status_code == 200 and content_type.split(';')[0].strip() in GENERIC_CONTENT_TYPES)
+        )
     except Exception as e:
         print(f"Ошибка при проверке заголовков для {url}: {e}")
-        return None
+        needs_sniff = True
+    
+    sniffed_type = None
+    if needs_sniff:
+        try:
+            sniffed_type, final_url, sniff_status = sniff_url_content_type(url)
+            category = get_category_from_mime_type(sniffed_type)
+            definitive = sniff_status in (200, 206) or sniff_status in MISSING_STATUSES
+        except Exception as e:
+            print(f"Ошибка при проверке первых байт для {url}: {e}")
+            return None
+    
+    if definitive:
+        url_cache.save_classification(url, category or 'other', content_type, final_url, sniffed_type)
+    return category
 
-def categorize_url(url):
-    """Категоризирует URL по типу контента"""
-    # Сначала проверяем YouTube
-    if is_youtube_url(url):
-        return 'youtube'
-    # Затем проверяем изображения
-    elif is_image_url(url):
-        return 'image'
-    # Затем проверяем видео (кроме YouTube)
-    elif is_video_url(url):
-        return 'video'
-    else:
-        # Если не удалось определить по URL, проверяем по HTTP заголовкам
-        content_type = check_content_type_by_headers(url)
-        if content_type:
-            return content_type
-        else:
-            # Если ничего не подошло, считаем остальными ссылками
-            return 'other'
+def check_content_type_limited(url):
+    """Проверяет тип контента по заголовкам с учетом лимита запросов на хост"""
+    with host_limiter.slot(url):
+        return check_content_type_by_headers(url)
 
-def collect_all_links_from_spreadsheet(spreadsheet_id, column, parse_links_dir):
-    """Собирает все ссылки из Google таблицы и сохраняет в all_links.txt"""
-    print(f"\n=== СБОР ВСЕХ ССЫЛОК ИЗ КОЛОНКИ {column} ===")
-    
+def categorize_url_by_pattern(url):
+    """Категоризирует URL только по домену и расширению, без сетевых запросов"""
+    return classify_url(url)['category']
+
+def categorize_short_link(url):
+    """Разрешает короткую ссылку и категоризирует ее по конечному адресу"""
+    final_url = resolve_short_link(url)
+    category = categorize_url_by_pattern(final_url) or categorize_url_by_pattern(url)
+    if category:
+        return category
+    return check_content_type_limited(final_url)
+
+def read_sheet_ranges(spreadsheet_id, ranges):
+    """
+    Читает все диапазоны одним запросом batch_get.
+    Возвращает список (префикс имени, ссылка на ячейку, значение) для непустых ячеек.
+    """
     # Загружаем переменные окружения
     load_dotenv()
     
@@ -173,94 +295,314 @@ def collect_all_links_from_spreadsheet(spreadsheet_id, column, parse_links_dir):
     creds = Credentials.from_service_account_info(service_account_info, scopes=scopes)
     gc = gspread.authorize(creds)
     
-    # Чтение таблицы
+    # Чтение всех диапазонов за один запрос
     sh = gc.open_by_key(spreadsheet_id)
-    worksheet = sh.worksheet('Лист1')
-    data = worksheet.col_values(ord(column.upper()) - ord('A') + 1)
+    requested = [
+        f"{quote_worksheet_name(worksheet or DEFAULT_WORKSHEET)}!{a1_range}"
+        for worksheet, a1_range in ranges
+    ]
+    response = sh.values_batch_get(requested)
+    
+    cells = []
+    for (worksheet, _), value_range in zip(ranges, response.get('valueRanges', [])):
+        # Для листа по умолчанию имена остаются прежними: "B12 1"
+        name_prefix = get_name_prefix(worksheet)
+        
+        # API возвращает фактический диапазон, например 'Лист1'!B1:D1000
+        start_cell = value_range['range'].rsplit('!', 1)[-1].split(':')[0]
+        start_match = re.match(r'([A-Z]+)(\d*)', start_cell)
+        start_col = column_letters_to_index(start_match.group(1))
+        start_row = int(start_match.group(2) or 1)
+        
+        for row_offset, row in enumerate(value_range.get('values', [])):
+            for col_offset, value in enumerate(row):
+                if value.strip():
+                    cell_ref = f"{column_index_to_letters(start_col + col_offset)}{start_row + row_offset}"
+                    cells.append((name_prefix, cell_ref, value))
     
-    all_links = []
+    return cells
+
+def get_cell_hash(value):
+    """Возвращает хэш содержимого ячейки"""
+    return hashlib.sha1(value.encode('utf-8')).hexdigest()
+
+def load_manifest(parse_links_dir):
+    """Загружает снимок ячеек предыдущих запусков или None, если его нет"""
+    manifest_path = os.path.join(parse_links_dir, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        return manifest['cells']
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"⚠️  Не удалось прочитать {MANIFEST_FILENAME}: {e}")
+        return None
+
+def save_manifest(parse_links_dir, manifest_cells):
+    """Сохраняет снимок ячеек всех разобранных диапазонов"""
+    manifest_path = os.path.join(parse_links_dir, MANIFEST_FILENAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'cells': manifest_cells}, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+def extract_links(cells, previous_cells=None):
+    """
+    Извлекает ссылки из ячеек, по одной за раз.
+    Для ячеек, не изменившихся с прошлого запуска, ссылки берутся из снимка
+    без повторного разбора. Категория определяется заново: для уже проверенных
+    ссылок она берется из url_cache, пока не истек срок хранения записи.
+    """
+    previous_cells = previous_cells or {}
     
-    # Обрабатываем каждую ячейку
-    for i, cell in enumerate(data, 1):
-        if cell.strip():
-            links = re.findall(r'https?://[^\s,;"\'<>]+', cell)
-            for idx, url in enumerate(links, 1):
-                link_info = {
+    for name_prefix, cell_ref, cell in cells:
+        cell_key = f"{name_prefix}{cell_ref}"
+        previous = previous_cells.get(cell_key)
+        
+        if previous and previous['hash'] == get_cell_hash(cell):
+            for idx, (display_name, url, _) in enumerate(previous['links'], 1):
+                yield {
                     'url': url,
-                    'cell_ref': f"{column}{i}",
+                    'cell_ref': cell_ref,
+                    'cell_key': cell_key,
                     'link_number': idx,
-                    'display_name': f"{column}{i} {idx}"
+                    'display_name': display_name
                 }
-                all_links.append(link_info)
-                print(f"[{link_info['display_name']}] {url}")
-    
-    # Сохраняем все ссылки в файл
-    all_links_file = os.path.join(parse_links_dir, 'all_links.txt')
-    with open(all_links_file, 'w', encoding='utf-8') as f:
-        f.write(f"# Все ссылки из колонки {column}\n")
-        f.write(f"# Дата создания: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"# Всего ссылок: {len(all_links)}\n\n")
+            continue
         
-        for link_info in all_links:
-            f.write(f"{link_info['display_name']} : {link_info['url']}\n")
-    
-    print(f"\n✓ Сохранено {len(all_links)} ссылок в файл: all_links.txt")
-    return all_links
-
-def categorize_links_from_file(all_links, parse_links_dir):
-    """Категоризирует ссылки из файла all_links.txt по типам"""
-    print(f"\n=== КАТЕГОРИЗАЦИЯ ССЫЛОК ===")
-    
-    # Словари для группировки ссылок
-    categorized_links = {
-        'image': [],
-        'youtube': [],
-        'video': [],
-        'other': []
-    }
-    
-    # Читаем ссылки из файла и категоризируем
-    all_links_file = os.path.join(parse_links_dir, 'all_links.txt')
-    with open(all_links_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+        links = re.findall(r'https?://[^\s,;"\'<>]+', cell)
+        for idx, url in enumerate(links, 1):
+            link_info = {
+                'url': url,
+                'cell_ref': cell_ref,
+                'cell_key': cell_key,
+                'link_number': idx,
+                'display_name': f"{name_prefix}{cell_ref} {idx}"
+            }
+            print(f"[{link_info['display_name']}] {url}")
+            yield link_info
+
+def normalize_links(links):
+    """Убирает знаки препинания, прилипшие к концу ссылки"""
+    for link_info in links:
+        url = link_info['url'].strip().rstrip('.')
+        if url:
+            link_info['url'] = url
+            yield link_info
+
+def classify_links(links, max_workers=PROBE_MAX_WORKERS):
+    """
+    Категоризирует поток ссылок, выполняя HEAD-запросы параллельно.
+    Ссылки выдаются в исходном порядке; одновременно в работе не больше
+    нескольких ссылок на поток, поэтому память не растет с размером таблицы.
+    """
+    window_size = max_workers * 4
+    pending = deque()
     
-    # Пропускаем заголовки (строки, начинающиеся с #)
-    for line in lines:
-        if line.startswith('#') or not line.strip():
-            continue
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for link_info in links:
+            url = link_info['url']
+            
+            if is_short_link(url):
+                # Короткие ссылки разрешаются в пуле потоков, конечный адрес попадает в кэш
+                pending.append((link_info, executor.submit(categorize_short_link, url)))
+            else:
+                # Сетевая проверка нужна только для ссылок, не распознанных по шаблону
+                category = categorize_url_by_pattern(url)
+                if category is None:
+                    pending.append((link_info, executor.submit(check_content_type_limited, url)))
+                else:
+                    pending.append((link_info, category))
+            
+            while len(pending) >= window_size:
+                yield resolve_pending_link(pending.popleft())
         
-        # Парсим строку формата "A1 1 : https://example.com"
-        parts = line.strip().split(' : ', 1)
-        if len(parts) == 2:
-            display_name = parts[0].strip()
-            url = parts[1].strip()
+        while pending:
+            yield resolve_pending_link(pending.popleft())
+
+def resolve_pending_link(pending_link):
+    """Дожидается результата проверки ссылки и возвращает (ссылка, категория)"""
+    link_info, result = pending_link
+    if isinstance(result, Future):
+        result = result.result() or 'other'
+    return link_info, result
+
+class LinkListWriter:
+    """Постепенно записывает ссылки в файл в формате "A1 1 : https://example.com" """
+    
+    # Ширина поля под количество ссылок, которое дописывается в заголовок в конце
+    COUNT_WIDTH = 12
+    
+    def __init__(self, filepath, title):
+        self.filepath = filepath
+        self.count = 0
+        self.file = open(filepath, 'w', encoding='utf-8')
+        self.file.write(f"# {title}\n")
+        self.file.write(f"# Дата создания: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        self.count_offset = self.file.tell()
+        self.file.write(f"# Всего ссылок: {'':<{self.COUNT_WIDTH}}\n\n")
+    
+    def write(self, link_info):
+        self.file.write(f"{link_info['display_name']} : {link_info['url']}\n")
+        self.count += 1
+    
+    def close(self):
+        # Возвращаемся к заголовку и вписываем итоговое количество ссылок
+        self.file.seek(self.count_offset)
+        self.file.write(f"# Всего ссылок: {self.count:<{self.COUNT_WIDTH}}")
+        self.file.close()
+
+def remove_delta_files(parse_links_dir):
+    """Удаляет файлы изменений от предыдущего запуска"""
+    for category in ['image', 'youtube', 'video', 'other']:
+        delta_path = os.path.join(parse_links_dir, f"{category}_links_delta.txt")
+        if os.path.exists(delta_path):
+            os.remove(delta_path)
+    removed_path = os.path.join(parse_links_dir, 'removed_links.txt')
+    if os.path.exists(removed_path):
+        os.remove(removed_path)
+
+def write_delta_files(parse_links_dir, previous_cells, manifest_cells):
+    """
+    Сравнивает ссылки с прошлым запуском и записывает изменения:
+    {category}_links_delta.txt — новые и измененные ссылки для скачивания,
+    removed_links.txt — ссылки, исчезнувшие из таблицы.
+    previous_cells должны содержать только ячейки диапазонов текущего запуска,
+    иначе ячейки других диапазонов попадут в удаленные.
+    """
+    previous_links = {
+        display_name: (url, category)
+        for cell in previous_cells.values()
+        for display_name, url, category in cell['links']
+    }
+    current_links = {
+        display_name: (url, category)
+        for cell in manifest_cells.values()
+        for display_name, url, category in cell['links']
+    }
+    
+    removed_path = os.path.join(parse_links_dir, 'removed_links.txt')
+    added_count = 0
+    changed_count = 0
+    delta_writers = {}
+    try:
+        for display_name, (url, category) in current_links.items():
+            previous = previous_links.get(display_name)
+            if previous == (url, category):
+                continue
             
-            category = categorize_url(url)
-            categorized_links[category].append({
-                'display_name': display_name,
-                'url': url
-            })
-            print(f"[{category.upper()}] {display_name}: {url}")
-    
-    # Сохраняем результаты в отдельные файлы
-    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-    
-    for category, links in categorized_links.items():
-        if links:
-            filename = f"{category}_links.txt"
-            filepath = os.path.join(parse_links_dir, filename)
+            if previous is None:
+                added_count += 1
+            else:
+                changed_count += 1
             
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(f"# Ссылки категории: {category}\n")
-                f.write(f"# Дата создания: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                f.write(f"# Всего ссылок: {len(links)}\n\n")
-                
-                for link_info in links:
-                    f.write(f"{link_info['display_name']} : {link_info['url']}\n")
+            writer = delta_writers.get(category)
+            if writer is None:
+                writer = LinkListWriter(
+                    os.path.join(parse_links_dir, f"{category}_links_delta.txt"),
+                    f"Новые и измененные ссылки категории: {category}"
+                )
+                delta_writers[category] = writer
+            writer.write({'display_name': display_name, 'url': url})
+    finally:
+        for writer in delta_writers.values():
+            writer.close()
+    
+    removed_links = [
+        (display_name, url) for display_name, (url, _) in previous_links.items()
+        if display_name not in current_links
+    ]
+    if removed_links:
+        removed_writer = LinkListWriter(removed_path, "Ссылки, удаленные из таблицы")
+        for display_name, url in removed_links:
+            removed_writer.write({'display_name': display_name, 'url': url})
+        removed_writer.close()
+    
+    print(f"\n=== ИЗМЕНЕНИЯ С ПРОШЛОГО ЗАПУСКА ===")
+    print(f"Добавлено: {added_count}, изменено: {changed_count}, удалено: {len(removed_links)}")
+    for category, writer in delta_writers.items():
+        print(f"✓ {writer.count} ссылок категории '{category}' в файле: {category}_links_delta.txt")
+    if removed_links:
+        print(f"✓ Удаленные ссылки сохранены в файл: removed_links.txt")
+
+def run_parse_pipeline(cells, ranges, ranges_label, parse_links_dir):
+    """
+    Обрабатывает ячейки потоком: извлечение -> нормализация -> категоризация ->
+    запись в all_links.txt и файлы категорий по мере поступления ссылок
+    """
+    print(f"\n=== СБОР И КАТЕГОРИЗАЦИЯ ССЫЛОК ИЗ {ranges_label} ===")
+    
+    all_links_writer = LinkListWriter(
+        os.path.join(parse_links_dir, 'all_links.txt'),
+        f"Все ссылки из {ranges_label}"
+    )
+    category_writers = {}
+    
+    # Снимок ячеек прошлых запусков и новый снимок, который заполняется по ходу
+    previous_cells = load_manifest(parse_links_dir)
+    manifest_cells = {
+        f"{name_prefix}{cell_ref}": {'hash': get_cell_hash(cell), 'links': []}
+        for name_prefix, cell_ref, cell in cells
+    }
+    
+    def collect(links):
+        for link_info in links:
+            all_links_writer.write(link_info)
+            yield link_info
+    
+    try:
+        links = collect(normalize_links(extract_links(cells, previous_cells)))
+        for link_info, category in classify_links(links):
+            manifest_cells[link_info['cell_key']]['links'].append(
+                [link_info['display_name'], link_info['url'], category]
+            )
             
-            print(f"\n✓ Сохранено {len(links)} ссылок категории '{category}' в файл: {filename}")
+            # Файл категории создается при появлении первой ссылки этой категории
+            writer = category_writers.get(category)
+            if writer is None:
+                writer = LinkListWriter(
+                    os.path.join(parse_links_dir, f"{category}_links.txt"),
+                    f"Ссылки категории: {category}"
+                )
+                category_writers[category] = writer
+            writer.write(link_info)
+            print(f"[{category.upper()}] {link_info['display_name']}: {link_info['url']}")
+    finally:
+        all_links_writer.close()
+        for writer in category_writers.values():
+            writer.close()
     
-    return categorized_links
+    print(f"\n✓ Сохранено {all_links_writer.count} ссылок в файл: all_links.txt")
+    
+    category_counts = {category: 0 for category in ['image', 'youtube', 'video', 'other']}
+    for category, writer in category_writers.items():
+        category_counts[category] = writer.count
+        print(f"✓ Сохранено {writer.count} ссылок категории '{category}' в файл: {category}_links.txt")
+    
+    # Файлы изменений от предыдущего запуска устарели в любом случае
+    remove_delta_files(parse_links_dir)
+    if previous_cells is None:
+        print(f"\nСнимок предыдущего запуска не найден, файлы изменений не создаются")
+        previous_cells = {}
+    else:
+        # Сравниваем только ячейки разобранных диапазонов: ячейки других
+        # диапазонов в этот раз не читались и удаленными не считаются
+        write_delta_files(parse_links_dir, {
+            cell_key: cell for cell_key, cell in previous_cells.items()
+            if is_cell_in_ranges(cell_key, ranges)
+        }, manifest_cells)
+    
+    # Ячейки других диапазонов остаются в снимке до их следующего разбора
+    other_cells = {
+        cell_key: cell for cell_key, cell in previous_cells.items()
+        if not is_cell_in_ranges(cell_key, ranges)
+    }
+    save_manifest(parse_links_dir, {**other_cells, **manifest_cells})
+    
+    return category_counts
 
 def main():
     print("=== СКРИПТ ПАРСИНГА ССЫЛОК ИЗ GOOGLE ТАБЛИЦЫ ===")
@@ -271,8 +613,11 @@ def main():
     # Запрашиваем ссылку на таблицу
     spreadsheet_id = extract_spreadsheet_id_from_url()
     
-    # Запрашиваем колонку
-    column = get_column_from_user()
+    # Запрашиваем колонки и диапазоны
+    ranges = get_ranges_from_user()
+    ranges_label = 'диапазонов ' + ', '.join(
+        f"{worksheet}!{a1_range}" if worksheet else a1_range for worksheet, a1_range in ranges
+    )
     
     # Создаем структуру директорий
     downloads_dir = os.path.expanduser('~/Downloads')
@@ -283,20 +628,25 @@ def main():
     # Создаем директории
     os.makedirs(parse_links_dir, exist_ok=True)
     
-    # Этап 1: Сбор всех ссылок из Google таблицы
-    all_links = collect_all_links_from_spreadsheet(spreadsheet_id, column, parse_links_dir)
+    # Чтение всех диапазонов из Google таблицы одним запросом
+    cells = read_sheet_ranges(spreadsheet_id, ranges)
+    
+    # Сбор и категоризация ссылок за один проход
+    category_counts = run_parse_pipeline(cells, ranges, ranges_label, parse_links_dir)
     
-    # Этап 2: Категоризация ссылок из файла
-    categorized_links = categorize_links_from_file(all_links, parse_links_dir)
+    # Удаляем устаревшие записи из кэша проверок
+    removed = url_cache.evict_expired()
+    if removed:
+        print(f"\n✓ Удалено {removed} устаревших записей из кэша ссылок")
     
     print(f"\n=== РЕЗУЛЬТАТЫ ===")
     print(f"Проект: {project_name}")
     print(f"Директория: {parse_links_dir}")
-    print(f"Изображения: {len(categorized_links['image'])} ссылок")
-    print(f"YouTube: {len(categorized_links['youtube'])} ссылок")
-    print(f"Видео (другие): {len(categorized_links['video'])} ссылок")
-    print(f"Остальные: {len(categorized_links['other'])} ссылок")
-    total_links = sum(len(links) for links in categorized_links.values())
+    print(f"Изображения: {category_counts['image']} ссылок")
+    print(f"YouTube: {category_counts['youtube']} ссылок")
+    print(f"Видео (другие): {category_counts['video']} ссылок")
+    print(f"Остальные: {category_counts['other']} ссылок")
+    total_links = sum(category_counts.values())
     print(f"Всего: {total_links} ссылок")
 
 if __name__ == "__main__":
@@ -1,11 +1,151 @@
 import os
+import codecs
+import json
 import requests
+import http_client
+import image_encoders
+import media_store
+import url_cache
 import re
-from urllib.parse import urlparse
+from urllib.parse import urlparse, parse_qs, unquote
 from datetime import datetime
-import time
+import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from bandwidth_limiter import get_bandwidth_limiter
+from host_limiter import HostLimiter
+from content_sniffer import SNIFF_BYTES, sniff_content_type
+from link_dedup import group_duplicate_links, link_or_copy_file
+from link_files import choose_links_file, read_removed_links
+from redirect_resolver import is_short_link, resolve_short_link, resolve_short_links
+from resumable_download import PART_SUFFIX, download_to_buffer
+from retry_policy import HostUnavailableError, RetryableStatusError, call_with_retry
+
+# Расширения файлов для MIME-типов изображений
+MIME_TYPE_EXTENSIONS = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+    'image/bmp': '.bmp',
+    'image/tiff': '.tiff',
+    'image/svg+xml': '.svg',
+    'image/avif': '.avif',
+    'image/heic': '.heic',
+    'image/heif': '.heif',
+}
+
+# Заголовки для страниц Google Images (без br: распаковка brotli требует отдельного пакета)
+GOOGLE_IMAGES_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate",
+    "DNT": "1",
+    "Upgrade-Insecure-Requests": "1"
+}
+
+# Поиск прямой ссылки на изображение в HTML страницы Google Images
+HTML_IMGURL_PATTERN = re.compile(r'imgurl=(https?[^&"\s\\]+)')
+HTML_IMAGE_URL_PATTERN = re.compile(r'https://[^"\s]+\.(?:jpg|jpeg|png|gif|webp|bmp|tiff)', re.IGNORECASE)
+# Символы, на которых заканчивается найденная ссылка каждого вида
+HTML_IMGURL_END_PATTERN = re.compile(r'[&"\s\\]')
+HTML_IMAGE_URL_END_PATTERN = re.compile(r'["\s]')
+HTML_SCAN_CHUNK_SIZE = 16 * 1024
+HTML_SCAN_OVERLAP = 8 * 1024
+
+# Размер блока чтения тела ответа и порог буфера в памяти
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+DEFAULT_SPOOL_MAX_MB = 32
+
+# Предельный размер декодируемого изображения по умолчанию, мегапикселей
+DEFAULT_MAX_MEGAPIXELS = 100
+
+# Сведения о скачанных изображениях для продолжения прерванного запуска
+MANIFEST_FILENAME = 'download_manifest.json'
+MANIFEST_SAVE_INTERVAL = 25
+
+# Результат download_image, когда изображение на сервере не изменилось (ответ 304)
+NOT_MODIFIED = 'not_modified'
+
+# Параллельное скачивание: общий лимит потоков и лимиты на один хост
+DEFAULT_DOWNLOAD_WORKERS = 8
+DEFAULT_PER_HOST_LIMIT = 4
+DEFAULT_HOST_INTERVAL_MS = 250
+
+_host_limiter = None
+_host_limiter_lock = threading.Lock()
+
+def get_host_limiter():
+    """
+    Возвращает общий ограничитель запросов к хостам.
+    IMAGE_PER_HOST_LIMIT — одновременных запросов к одному хосту,
+    IMAGE_HOST_INTERVAL_MS — минимальный интервал между запросами к одному хосту.
+    """
+    global _host_limiter
+    with _host_limiter_lock:
+        if _host_limiter is None:
+            _host_limiter = HostLimiter(
+                http_client.get_int_setting('IMAGE_PER_HOST_LIMIT', DEFAULT_PER_HOST_LIMIT),
+                http_client.get_int_setting('IMAGE_HOST_INTERVAL_MS', DEFAULT_HOST_INTERVAL_MS) / 1000
+            )
+    return _host_limiter
+
+def get_download_workers():
+    """Количество одновременных скачиваний (IMAGE_DOWNLOAD_WORKERS)"""
+    return max(1, http_client.get_int_setting('IMAGE_DOWNLOAD_WORKERS', DEFAULT_DOWNLOAD_WORKERS))
+
+def get_imgurl_param(url):
+    """Возвращает значение параметра imgurl из адреса Google Images или None"""
+    if 'imgurl=' not in url:
+        return None
+    query_params = parse_qs(urlparse(url).query)
+    if 'imgurl' in query_params:
+        return unquote(query_params['imgurl'][0])
+    return None
+
+def find_final_match(pattern, end_pattern, text, finished):
+    """
+    Ищет pattern в тексте, полученном не целиком. Совпадение принимается,
+    только если после него в тексте уже есть символ end_pattern, на котором
+    ссылка заканчивается, иначе продолжение страницы могло бы ее удлинить.
+    """
+    match = pattern.search(text)
+    if match and (finished or end_pattern.search(text, match.end())):
+        return match
+    return None
+
+def scan_html_for_image_url(response):
+    """
+    Читает HTML-страницу потоком и возвращает первую найденную прямую ссылку
+    на изображение (параметр imgurl или адрес файла) или None. Соединение
+    закрывается сразу после находки, остаток страницы не скачивается.
+    """
+    decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')(errors='replace')
+    window = ''
+    try:
+        chunks = response.iter_content(chunk_size=HTML_SCAN_CHUNK_SIZE)
+        finished = False
+        while not finished:
+            chunk = next(chunks, None)
+            finished = chunk is None
+            window += decoder.decode(chunk or b'', final=finished)
+            
+            match = find_final_match(HTML_IMGURL_PATTERN, HTML_IMGURL_END_PATTERN, window, finished)
+            if match:
+                return unquote(match.group(1))
+            match = find_final_match(HTML_IMAGE_URL_PATTERN, HTML_IMAGE_URL_END_PATTERN, window, finished)
+            if match:
+                return match.group(0)
+            
+            # Держим только хвост страницы, в котором может начинаться еще не законченная ссылка
+            window = window[-HTML_SCAN_OVERLAP:]
+        return None
+    finally:
+        response.close()
 
 def extract_google_image_url(url):
     """Извлекает прямую ссылку на изображение из Google Images"""
@@ -13,55 +153,36 @@ def extract_google_image_url(url):
         return url
     
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,image/apng,*/*;q=0.8",
-            "Accept-Language": "en-US,en;q=0.9",
-            "Accept-Encoding": "gzip, deflate, br",
-            "DNT": "1",
-            "Upgrade-Insecure-Requests": "1"
-        }
-        
         print(f"  🔍 Извлекаю прямую ссылку из Google Images...")
-        response = requests.get(url, headers=headers, timeout=15, allow_redirects=True)
+        
+        # Конечный адрес короткой ссылки берется из общего кэша (его заполняет и парсинг)
+        final_url = resolve_short_link(url)
+        direct_url = get_imgurl_param(final_url)
+        if direct_url:
+            print(f"  ✓ Найдена прямая ссылка: {direct_url}")
+            return direct_url
+        
+        response = http_client.get(final_url, headers=GOOGLE_IMAGES_HEADERS, timeout=15, stream=True)
         
         if response.status_code == 200:
             print(f"  📍 Финальный URL после редиректа: {response.url}")
             
             # Ищем параметр imgurl в URL
-            if 'imgurl=' in response.url:
-                # Извлекаем imgurl параметр
-                import urllib.parse
-                parsed_url = urllib.parse.urlparse(response.url)
-                query_params = urllib.parse.parse_qs(parsed_url.query)
-                
-                if 'imgurl' in query_params:
-                    direct_url = query_params['imgurl'][0]
-                    # Декодируем URL
-                    direct_url = urllib.parse.unquote(direct_url)
-                    print(f"  ✓ Найдена прямая ссылка: {direct_url}")
-                    return direct_url
-                else:
-                    print(f"  ⚠️  Параметр imgurl не найден в URL")
+            direct_url = get_imgurl_param(response.url)
+            if direct_url:
+                response.close()
+                print(f"  ✓ Найдена прямая ссылка: {direct_url}")
+                return direct_url
             else:
                 print(f"  ⚠️  Параметр imgurl не найден в URL")
             
-            # Если не нашли imgurl, ищем в HTML
-            html_content = response.text
-            # Ищем ссылки на изображения в HTML
-            import re
-            img_patterns = [
-                r'https://[^"\s]+\.(?:jpg|jpeg|png|gif|webp|bmp|tiff)',
-                r'https://[^"\s]+\.(?:jpg|jpeg|png|gif|webp|bmp|tiff)\?[^"\s]*'
-            ]
-            
-            for pattern in img_patterns:
-                matches = re.findall(pattern, html_content, re.IGNORECASE)
-                if matches:
-                    # Берем первую найденную ссылку на изображение
-                    direct_url = matches[0]
-                    print(f"  ✓ Найдена прямая ссылка в HTML: {direct_url}")
-                    return direct_url
+            # Если не нашли imgurl, ищем в HTML по мере загрузки страницы
+            direct_url = scan_html_for_image_url(response)
+            if direct_url:
+                print(f"  ✓ Найдена прямая ссылка в HTML: {direct_url}")
+                return direct_url
+        else:
+            response.close()
         
         print(f"  ⚠️  Не удалось извлечь прямую ссылку, используем оригинальную")
         return url
@@ -107,13 +228,78 @@ def check_and_install_dependencies():
     print("✓ Все зависимости готовы\n")
     return True
 
-def convert_to_jpg(input_path, output_path):
-    """Конвертирует изображение в JPG формат"""
+def get_max_dimension():
+    """Наибольшая сторона итогового изображения в пикселях (IMAGE_MAX_DIMENSION), 0 — без уменьшения"""
+    return max(0, http_client.get_int_setting('IMAGE_MAX_DIMENSION', 0))
+
+def get_max_pixels():
+    """Предельный размер изображения для декодирования (IMAGE_MAX_MEGAPIXELS), защита от «бомб»"""
+    return max(1, http_client.get_int_setting('IMAGE_MAX_MEGAPIXELS', DEFAULT_MAX_MEGAPIXELS)) * 1000000
+
+def get_store_extension():
+    """Расширение JPG в хранилище: уменьшенные копии хранятся отдельно от полноразмерных"""
+    max_dimension = get_max_dimension()
+    return f'_{max_dimension}px.jpg' if max_dimension else '.jpg'
+
+def get_target_size(size, max_dimension):
+    """Размер изображения, вписанного в квадрат max_dimension с сохранением пропорций"""
+    width, height = size
+    scale = max_dimension / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def exceeds_max_dimension(buffer):
+    """Проверяет по заголовку файла, больше ли изображение IMAGE_MAX_DIMENSION"""
+    max_dimension = get_max_dimension()
+    if not max_dimension:
+        return False
+    
+    from PIL import Image
+    # Читается только заголовок, поэтому проверка Pillow на «бомбы» здесь не нужна
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        with Image.open(buffer) as img:
+            return max(img.size) > max_dimension
+    except Exception:
+        return False
+    finally:
+        buffer.seek(0)
+
+def convert_to_jpg(source, output_path):
+    """
+    Конвертирует изображение (путь к файлу или открытый буфер) в JPG формат.
+    Если задан IMAGE_MAX_DIMENSION, большие изображения уменьшаются уже при
+    декодировании: JPEG — в режиме draft, остальные — быстрым reduce.
+    """
     try:
         from PIL import Image
         
-        # Открываем изображение
-        with Image.open(input_path) as img:
+        max_dimension = get_max_dimension()
+        max_pixels = get_max_pixels()
+        # Встроенную проверку Pillow при открытии отключаем: размер проверяется
+        # ниже, уже с учетом уменьшения JPEG при декодировании
+        Image.MAX_IMAGE_PIXELS = None
+        
+        # Открываем изображение (читается только заголовок)
+        with Image.open(source) as img:
+            target_size = None
+            if max_dimension and max(img.size) > max_dimension:
+                target_size = get_target_size(img.size, max_dimension)
+                if img.format == 'JPEG':
+                    # JPEG декодируется сразу в масштабе 1/2, 1/4 или 1/8,
+                    # img.size после draft — размер, который будет декодирован
+                    img.draft('RGB', target_size)
+            
+            # Проверяем размер до декодирования, чтобы не занять сотни МБ памяти
+            width, height = img.size
+            if width * height > max_pixels:
+                print(f"  ❌ Слишком большое изображение: {width}x{height}")
+                return False
+            
+            if target_size:
+                # thumbnail сначала уменьшает изображение в целое число раз (reduce),
+                # затем доводит до нужного размера быстрым билинейным фильтром
+                img.thumbnail(target_size, Image.BILINEAR, reducing_gap=2.0)
+            
             # Конвертируем в RGB если изображение в другом режиме (например, RGBA)
             if img.mode in ('RGBA', 'LA', 'P'):
                 # Создаем белый фон для прозрачных изображений
@@ -133,6 +319,78 @@ def convert_to_jpg(input_path, output_path):
         print(f"  ❌ Ошибка конвертации: {e}")
         return False
 
+class ImageConverter:
+    """
+    Второй этап конвейера: конвертация в пуле процессов.
+    Потоки скачивания записывают изображения во временные файлы и ставят их
+    в ограниченную очередь; когда она заполнена, submit ждет. Процесс
+    конвертации сам открывает файл, поэтому изображение не копируется в память
+    и не передается между процессами целиком.
+    """
+    
+    def __init__(self, workers, queue_size):
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.slots = threading.BoundedSemaphore(queue_size)
+    
+    def submit(self, buffer, digest, filename, extension, download_dir):
+        """
+        Ставит изображение из буфера в очередь конвертации, возвращает Future
+        с путем к файлу. Буфер можно закрыть сразу после вызова.
+        """
+        result = Future()
+        store_path = media_store.get_store_path(download_dir, digest, get_store_extension())
+        temp_path = media_store.get_temp_path(store_path)
+        source_path = media_store.get_temp_path(store_path)
+        
+        def finish(conversion):
+            self.slots.release()
+            try:
+                try:
+                    converted = conversion.result()
+                except Exception as e:
+                    print(f"  ❌ Ошибка конвертации {filename}: {e}")
+                    converted = False
+                
+                if converted:
+                    media_store.commit_file(temp_path, store_path)
+                    final_filepath = link_or_copy_file(store_path, filename, download_dir)
+                    print(f"  ✓ Конвертировано и сохранено: {os.path.basename(final_filepath)}")
+                    result.set_result(final_filepath)
+                else:
+                    # Если конвертация не удалась, сохраняем оригинальный файл
+                    media_store.discard_file(temp_path)
+                    original_filepath = get_free_filepath(download_dir, filename, extension)
+                    os.replace(source_path, original_filepath)
+                    print(f"  ⚠️  Сохранено без конвертации: {os.path.basename(original_filepath)}")
+                    result.set_result(original_filepath)
+            except Exception as e:
+                print(f"  ❌ Ошибка: {e}")
+                result.set_result(None)
+            finally:
+                media_store.discard_file(source_path)
+        
+        self.slots.acquire()
+        try:
+            # Файл читается по частям, даже если буфер еще не сброшен на диск
+            save_buffer(buffer, source_path)
+            self.executor.submit(convert_to_jpg, source_path, temp_path).add_done_callback(finish)
+        except Exception:
+            self.slots.release()
+            media_store.discard_file(source_path)
+            raise
+        return result
+    
+    def shutdown(self):
+        self.executor.shutdown()
+
+def get_convert_workers():
+    """Количество процессов конвертации (IMAGE_CONVERT_WORKERS), по умолчанию — число ядер"""
+    return max(1, http_client.get_int_setting('IMAGE_CONVERT_WORKERS', os.cpu_count() or 1))
+
+def get_convert_queue_size(workers):
+    """Сколько скачанных изображений может ждать конвертации (IMAGE_CONVERT_QUEUE)"""
+    return max(1, http_client.get_int_setting('IMAGE_CONVERT_QUEUE', workers * 2))
+
 def get_project_name():
     """Запрашивает у пользователя название проекта"""
     while True:
@@ -164,135 +422,150 @@ def get_file_extension_from_url(url):
     # По умолчанию возвращаем .jpg
     return '.jpg'
 
-def get_file_extension_from_headers(url):
-    """Определяет расширение файла по HTTP заголовкам"""
-    try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        response = requests.head(url, headers=headers, timeout=10, allow_redirects=True)
-        
-        if response.status_code == 200:
-            content_type = response.headers.get('content-type', '').lower()
-            
-            if 'image/jpeg' in content_type or 'image/jpg' in content_type:
-                return '.jpg'
-            elif 'image/png' in content_type:
-                return '.png'
-            elif 'image/gif' in content_type:
-                return '.gif'
-            elif 'image/webp' in content_type:
-                return '.webp'
-            elif 'image/bmp' in content_type:
-                return '.bmp'
-            elif 'image/tiff' in content_type:
-                return '.tiff'
-            elif 'image/svg+xml' in content_type:
-                return '.svg'
-        
-        return None
-    except Exception as e:
-        print(f"Ошибка при проверке заголовков для {url}: {e}")
-        return None
+def get_file_extension_from_content_type(content_type):
+    """Определяет расширение файла по MIME-типу (из заголовка или сигнатуры)"""
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    return MIME_TYPE_EXTENSIONS.get(content_type)
 
-def sanitize_filename(filename):
-    """Очищает имя файла от недопустимых символов"""
-    # Заменяем недопустимые символы на подчеркивание
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    
-    # Убираем лишние пробелы и подчеркивания
-    filename = re.sub(r'\s+', '_', filename)
-    filename = re.sub(r'_+', '_', filename)
-    
-    return filename.strip('_')
+def get_file_extension_from_response(headers, first_chunk):
+    """
+    Определяет расширение по уже полученному ответу GET: сначала по первым
+    байтам тела, затем по заголовку content-type. Отдельный запрос не нужен.
+    """
+    sniffed_type = sniff_content_type(first_chunk)
+    return (get_file_extension_from_content_type(sniffed_type)
+            or get_file_extension_from_content_type(headers.get('content-type')))
+
+def get_free_filepath(download_dir, filename, extension):
+    """Возвращает путь к файлу, добавляя суффикс _N, если имя уже занято"""
+    filepath = os.path.join(download_dir, filename + extension)
+    counter = 1
+    while os.path.exists(filepath):
+        filepath = os.path.join(download_dir, f"{filename}_{counter}{extension}")
+        counter += 1
+    return filepath
+
+def get_spool_max_bytes():
+    """Размер, до которого скачиваемое изображение держится в памяти (IMAGE_SPOOL_MAX_MB)"""
+    return max(1, http_client.get_int_setting('IMAGE_SPOOL_MAX_MB', DEFAULT_SPOOL_MAX_MB)) * 1024 * 1024
 
-def download_image(url, filename, download_dir):
-    """Скачивает изображение по URL и конвертирует в JPG"""
+def save_buffer(buffer, filepath):
+    """Записывает содержимое буфера в файл"""
+    buffer.seek(0)
+    with open(filepath, 'wb') as f:
+        shutil.copyfileobj(buffer, f, DOWNLOAD_CHUNK_SIZE)
+
+def get_revalidation_validators(direct_url, download_dir):
+    """
+    Возвращает валидаторы прошлого ответа для условного запроса, если
+    соответствующий JPG еще есть в хранилище, иначе None
+    """
+    validators = url_cache.get_http_validators(direct_url)
+    if validators and validators['digest']:
+        if os.path.exists(media_store.get_store_path(download_dir, validators['digest'], get_store_extension())):
+            return validators
+    return None
+
+def download_image(url, filename, download_dir, revalidate=False, converter=None):
+    """
+    Скачивает изображение по URL и конвертирует в JPG.
+    Оборванная передача сохраняется в filename.part и докачивается.
+    Временные ошибки (таймауты, 429, 503) повторяются с паузой, см. retry_policy.
+    При revalidate=True запрос делается условным по ETag/Last-Modified прошлого запуска.
+    Возвращает путь к сохраненному файлу, NOT_MODIFIED, если изображение
+    на сервере не изменилось, или None при ошибке. Если передан converter
+    (ImageConverter) и изображение нужно конвертировать, возвращает Future,
+    который завершится путем к файлу после конвертации.
+    """
     try:
         # Извлекаем прямую ссылку для Google Images
         direct_url = extract_google_image_url(url)
         
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        }
-        
         print(f"Скачиваю: {filename}")
-        response = requests.get(direct_url, headers=headers, timeout=30, allow_redirects=True, stream=True)
+        part_path = os.path.join(download_dir, filename + PART_SUFFIX)
+        validators = get_revalidation_validators(direct_url, download_dir) if revalidate else None
         
-        if response.status_code == 200:
+        def fetch():
+            # Не больше IMAGE_PER_HOST_LIMIT запросов к одному хосту одновременно;
+            # место у хоста не занимается на время паузы перед повтором
+            with get_host_limiter().slot(direct_url):
+                return download_to_buffer(direct_url, part_path, get_spool_max_bytes(),
+                                          DOWNLOAD_CHUNK_SIZE, validators=validators,
+                                          limiter=get_bandwidth_limiter('images'))
+        
+        buffer, headers, digest = call_with_retry(fetch, direct_url)
+        
+        if buffer is None:
+            if digest:
+                # Ответ 304: уже сконвертированный JPG остается как есть
+                url_cache.save_http_validators(direct_url, validators['etag'], validators['last_modified'], digest)
+                print(f"  ✓ Не изменилось на сервере")
+                return NOT_MODIFIED
+            return None
+        
+        # Запоминаем валидаторы для условного запроса в следующих запусках
+        url_cache.save_http_validators(direct_url, headers.get('etag'), headers.get('last-modified'), digest)
+        
+        with buffer:
+            # Такое же содержимое уже скачано по другой ссылке — конвертировать не нужно
+            stored_path = media_store.find_stored_file(download_dir, digest, get_store_extension())
+            if stored_path:
+                final_filepath = link_or_copy_file(stored_path, filename, download_dir)
+                print(f"  ✓ Уже есть в хранилище: {os.path.basename(final_filepath)}")
+                return final_filepath
+            
             # Проверяем, что это действительно изображение
-            content_type = response.headers.get('content-type', '').lower()
+            content_type = headers.get('content-type', '').lower()
             if not content_type.startswith('image/'):
                 print(f"  ⚠️  Предупреждение: {content_type} - не изображение")
             
-            # Определяем расширение файла для временного сохранения
-            extension = get_file_extension_from_headers(url)
+            # Определяем расширение по заголовкам и первым байтам тела того же ответа
+            first_chunk = buffer.read(SNIFF_BYTES)
+            buffer.seek(0)
+            extension = get_file_extension_from_response(headers, first_chunk)
             if not extension:
-                extension = get_file_extension_from_url(url)
-            
-            # Создаем временное имя файла с оригинальным расширением
-            temp_filename = filename + extension
-            temp_filepath = os.path.join(download_dir, temp_filename)
-            
-            # Проверяем, не существует ли уже файл с таким именем
-            counter = 1
-            original_temp_filepath = temp_filepath
-            while os.path.exists(temp_filepath):
-                name_without_ext = os.path.splitext(original_temp_filepath)[0]
-                ext = os.path.splitext(original_temp_filepath)[1]
-                temp_filepath = f"{name_without_ext}_{counter}{ext}"
-                counter += 1
-            
-            # Сохраняем временный файл
-            with open(temp_filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+                extension = get_file_extension_from_url(direct_url)
             
-            # Создаем финальное имя файла в JPG
-            final_filename = filename + '.jpg'
-            final_filepath = os.path.join(download_dir, final_filename)
-            
-            # Проверяем, не существует ли уже JPG файл с таким именем
-            counter = 1
-            original_final_filepath = final_filepath
-            while os.path.exists(final_filepath):
-                name_without_ext = os.path.splitext(original_final_filepath)[0]
-                final_filepath = f"{name_without_ext}_{counter}.jpg"
-                counter += 1
-            
-            # Конвертируем в JPG
-            if extension.lower() == '.jpg':
-                # Если уже JPG, просто переименовываем
-                os.rename(temp_filepath, final_filepath)
+            if extension.lower() == '.jpg' and not exceeds_max_dimension(buffer):
+                # Если уже JPG подходящего размера, записываем как есть
+                stored_path = media_store.store_file(download_dir, digest, get_store_extension(),
+                                                     lambda path: save_buffer(buffer, path))
+                final_filepath = link_or_copy_file(stored_path, filename, download_dir)
                 print(f"  ✓ Сохранено: {os.path.basename(final_filepath)}")
+            elif converter is not None:
+                # Конвертация уходит в пул процессов, поток сразу берется за следующее скачивание
+                return converter.submit(buffer, digest, filename, extension, download_dir)
             else:
-                # Конвертируем в JPG
-                if convert_to_jpg(temp_filepath, final_filepath):
-                    # Удаляем временный файл
-                    os.remove(temp_filepath)
+                # Конвертируем в JPG прямо из буфера
+                stored_path = media_store.store_file(download_dir, digest, get_store_extension(),
+                                                     lambda path: convert_to_jpg(buffer, path))
+                if stored_path:
+                    final_filepath = link_or_copy_file(stored_path, filename, download_dir)
                     print(f"  ✓ Конвертировано и сохранено: {os.path.basename(final_filepath)}")
                 else:
-                    # Если конвертация не удалась, оставляем оригинальный файл
-                    print(f"  ⚠️  Сохранено без конвертации: {os.path.basename(temp_filepath)}")
-            
-            return True
-            
-        else:
-            print(f"  ❌ Ошибка HTTP: {response.status_code}")
-            return False
+                    # Если конвертация не удалась, сохраняем оригинальный файл
+                    original_filepath = get_free_filepath(download_dir, filename, extension)
+                    save_buffer(buffer, original_filepath)
+                    print(f"  ⚠️  Сохранено без конвертации: {os.path.basename(original_filepath)}")
+                    return original_filepath
+        
+        return final_filepath
             
+    except HostUnavailableError as e:
+        print(f"  ❌ Пропускаю: {e}")
+        return None
+    except RetryableStatusError as e:
+        print(f"  ❌ Ошибка HTTP: {e.status_code}")
+        return None
     except requests.exceptions.Timeout:
         print(f"  ❌ Таймаут при скачивании")
-        return False
+        return None
     except requests.exceptions.ConnectionError:
         print(f"  ❌ Ошибка соединения")
-        return False
+        return None
     except Exception as e:
         print(f"  ❌ Ошибка: {e}")
-        return False
+        return None
 
 def read_image_links(image_links_file):
     """Читает ссылки на изображения из файла"""
@@ -326,7 +599,7 @@ def read_image_links(image_links_file):
         return []
 
 def create_error_placeholder(display_name, download_dir):
-    """Создает изображение-заглушку для неудачных скачиваний"""
+    """Создает изображение-заглушку для неудачных скачиваний, возвращает путь к ней или None"""
     try:
         from PIL import Image, ImageDraw, ImageFont
         
@@ -360,37 +633,115 @@ def create_error_placeholder(display_name, download_dir):
         # Рисуем текст черным цветом
         draw.text((x, y), text, fill='black', font=font)
         
-        # Сохраняем изображение
-        filename = display_name + '.jpg'
-        filepath = os.path.join(download_dir, filename)
-        
-        # Проверяем, не существует ли уже файл с таким именем
-        counter = 1
-        original_filepath = filepath
-        while os.path.exists(filepath):
-            name_without_ext = os.path.splitext(original_filepath)[0]
-            filepath = f"{name_without_ext}_{counter}.jpg"
-            counter += 1
+        # Сохраняем изображение в формате заглушек (PLACEHOLDER_FORMAT)
+        encoder_settings = image_encoders.get_output_settings()
+        extension = image_encoders.get_extension(encoder_settings)
+        filepath = get_free_filepath(download_dir, display_name, extension)
         
-        img.save(filepath, 'JPEG', quality=95)
+        image_encoders.encode_image(img, filepath, encoder_settings)
         print(f"  ✓ Создана заглушка: {os.path.basename(filepath)}")
-        return True
+        return filepath
         
     except Exception as e:
         print(f"  ❌ Ошибка создания заглушки: {e}")
-        return False
+        return None
 
 def log_download_error(display_name, url, error_file_path, download_dir):
-    """Логирует ошибки скачивания в файл и создает заглушку"""
+    """Логирует ошибки скачивания в файл и создает заглушку, возвращает путь к заглушке"""
     try:
         with open(error_file_path, 'a', encoding='utf-8') as f:
             f.write(f"{display_name} : {url}\n")
         
         # Создаем изображение-заглушку
-        create_error_placeholder(display_name, download_dir)
+        return create_error_placeholder(display_name, download_dir)
         
     except Exception as e:
         print(f"Ошибка при записи в файл ошибок: {e}")
+        return None
+
+def load_download_manifest(download_dir):
+    """
+    Загружает сведения о прошлых запусках:
+    {имя: {'url': ссылка, 'file': имя файла, 'status': 'done' или 'error'}}
+    """
+    manifest_path = os.path.join(download_dir, MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"⚠️  Не удалось прочитать {MANIFEST_FILENAME}, все изображения будут скачаны заново: {e}")
+        return {}
+
+def save_download_manifest(download_dir, manifest):
+    """Сохраняет сведения о скачанных изображениях"""
+    manifest_path = os.path.join(download_dir, MANIFEST_FILENAME)
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+def is_already_downloaded(manifest, link_info, download_dir):
+    """Проверяет, что изображение этой ячейки уже скачано по той же ссылке"""
+    entry = manifest.get(link_info['display_name'])
+    return (entry is not None and entry['status'] == 'done' and entry['url'] == link_info['url']
+            and os.path.exists(os.path.join(download_dir, entry['file'])))
+
+def remove_previous_file(manifest, link_info, download_dir):
+    """Удаляет файл ячейки из прошлого запуска (заглушку или изображение по старой ссылке)"""
+    entry = manifest.pop(link_info['display_name'], None)
+    if entry and entry.get('file'):
+        previous_path = os.path.join(download_dir, entry['file'])
+        if os.path.exists(previous_path):
+            os.remove(previous_path)
+
+def remove_deleted_cells(manifest, removed_links, download_dir):
+    """
+    Удаляет файлы ячеек, ссылки из которых исчезли из таблицы (removed_links.txt
+    от 1_parse_links.py). Возвращает количество удаленных ячеек.
+    """
+    removed_count = 0
+    for link_info in removed_links:
+        entry = manifest.get(link_info['display_name'])
+        if entry and entry['url'] == link_info['url']:
+            remove_previous_file(manifest, link_info, download_dir)
+            removed_count += 1
+    return removed_count
+
+def replace_previous_file(manifest, link_info, new_path, download_dir):
+    """
+    Ставит новый файл ячейки на место файла из прошлого запуска, чтобы
+    имя не менялось при обновлении изображения. Возвращает итоговый путь.
+    """
+    entry = manifest.get(link_info['display_name'])
+    if entry and entry.get('file'):
+        previous_path = os.path.join(download_dir, entry['file'])
+        if (previous_path != new_path and os.path.exists(previous_path)
+                and os.path.splitext(previous_path)[1] == os.path.splitext(new_path)[1]):
+            if os.path.samefile(new_path, previous_path):
+                # Содержимое не изменилось: обе ссылки ведут на один файл хранилища,
+                # а rename для одного и того же файла ничего не делает
+                os.remove(new_path)
+            else:
+                os.replace(new_path, previous_path)
+            return previous_path
+    remove_previous_file(manifest, link_info, download_dir)
+    return new_path
+
+def write_error_file(error_file_path, manifest):
+    """Переписывает файл ошибок: ячейки, которые не удалось скачать ни в одном запуске"""
+    failed = [(name, entry['url']) for name, entry in manifest.items() if entry['status'] == 'error']
+    if not failed:
+        if os.path.exists(error_file_path):
+            os.remove(error_file_path)
+        return
+    
+    temp_path = error_file_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        for display_name, url in failed:
+            f.write(f"{display_name} : {url}\n")
+    os.replace(temp_path, error_file_path)
 
 def main():
     print("=== СКРИПТ СКАЧИВАНИЯ ИЗОБРАЖЕНИЙ ===")
@@ -420,21 +771,27 @@ def main():
     os.makedirs(pictures_dir, exist_ok=True)
     
     # Путь к файлу с ссылками на изображения
-    image_links_file = os.path.join(parse_links_dir, 'image_links.txt')
+    image_links_file = choose_links_file(parse_links_dir, 'image')
     
-    # Путь к файлу ошибок
+    # Путь к файлу ошибок (в конце запуска он переписывается по итогам всех запусков)
     error_file_path = os.path.join(pictures_dir, 'download_img_errors.txt')
     
-    # Очищаем файл ошибок
-    if os.path.exists(error_file_path):
-        os.remove(error_file_path)
-    
     print(f"\n=== СКАЧИВАНИЕ ИЗОБРАЖЕНИЙ ===")
     print(f"Проект: {project_name}")
     print(f"Директория изображений: {pictures_dir}")
     print(f"Файл с ссылками: {image_links_file}")
     print("Все изображения будут конвертированы в JPG формат")
     
+    # Ячейки, удаленные из таблицы с прошлого парсинга, больше не нужны
+    removed_links = read_removed_links(parse_links_dir)
+    if removed_links:
+        manifest = load_download_manifest(pictures_dir)
+        removed_count = remove_deleted_cells(manifest, removed_links, pictures_dir)
+        if removed_count:
+            save_download_manifest(pictures_dir, manifest)
+            write_error_file(error_file_path, manifest)
+            print(f"Удалено файлов ячеек, которых больше нет в таблице: {removed_count}")
+    
     # Читаем ссылки на изображения
     image_links = read_image_links(image_links_file)
     
@@ -448,24 +805,140 @@ def main():
     successful_downloads = 0
     failed_downloads = 0
     
-    for i, link_info in enumerate(image_links, 1):
-        print(f"\n[{i}/{len(image_links)}] Обрабатываю: {link_info['display_name']}")
-        
-        if download_image(link_info['url'], link_info['display_name'], pictures_dir):
-            successful_downloads += 1
+    # Разрешаем короткие ссылки заранее и параллельно (результат попадает в кэш)
+    short_links = [link_info['url'] for link_info in image_links if is_short_link(link_info['url'])]
+    if short_links:
+        print(f"Разрешаю {len(short_links)} коротких ссылок...")
+        resolve_short_links(short_links)
+    
+    # Одинаковые изображения из разных ячеек скачиваем один раз
+    link_groups = group_duplicate_links(image_links)
+    duplicate_count = len(image_links) - len(link_groups)
+    if duplicate_count:
+        print(f"Повторяющихся ссылок: {duplicate_count} (будут скачаны один раз)")
+    
+    # Изображения, скачанные в прошлых запусках по тем же ссылкам, пропускаем
+    # или проверяем на сервере условным запросом
+    manifest = load_download_manifest(pictures_dir)
+    completed_groups = []
+    pending_groups = []
+    for link_info, duplicates in link_groups:
+        group = [link_info] + duplicates
+        if all(is_already_downloaded(manifest, group_link, pictures_dir) for group_link in group):
+            completed_groups.append((link_info, duplicates))
+            continue
+        # Заглушки и изображения по старым ссылкам освобождают имена для новых файлов
+        for group_link in group:
+            remove_previous_file(manifest, group_link, pictures_dir)
+        pending_groups.append((link_info, duplicates, False))
+    
+    skipped_downloads = 0
+    unchanged_downloads = 0
+    kept_downloads = 0
+    if completed_groups:
+        completed_count = sum(len(duplicates) + 1 for _, duplicates in completed_groups)
+        print(f"\nУже скачано в прошлых запусках: {completed_count}")
+        answer = input('Проверить, не изменились ли они на сервере? (y/n): ').strip().lower()
+        if answer in ('y', 'yes', 'д', 'да'):
+            pending_groups.extend((link_info, duplicates, True) for link_info, duplicates in completed_groups)
         else:
-            failed_downloads += 1
-            log_download_error(link_info['display_name'], link_info['url'], error_file_path, pictures_dir)
-        
-        # Небольшая пауза между запросами
-        time.sleep(0.5)
+            skipped_downloads = completed_count
+    
+    # Конвейер: потоки скачивают, пул процессов конвертирует; учет результатов,
+    # файл ошибок и заглушки — в основном потоке
+    workers = get_download_workers()
+    convert_workers = get_convert_workers()
+    converter = ImageConverter(convert_workers, get_convert_queue_size(convert_workers))
+    print(f"Одновременных скачиваний: {workers}, процессов конвертации: {convert_workers}")
+    ratelimit = get_bandwidth_limiter('images').get_ratelimit()
+    if ratelimit:
+        print(f"Ограничение скорости: {ratelimit // 1024} КБ/с (общее с другими скриптами)")
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(download_image, link_info['url'], link_info['display_name'], pictures_dir, revalidate, converter): (link_info, duplicates, revalidate)
+                for link_info, duplicates, revalidate in pending_groups
+            }
+            pending = set(futures)
+            processed = 0
+            
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    link_info, duplicates, revalidate = futures.pop(future)
+                    saved_path = future.result()
+                    if isinstance(saved_path, Future):
+                        # Изображение скачано и ждет конвертации
+                        futures[saved_path] = (link_info, duplicates, revalidate)
+                        pending.add(saved_path)
+                        continue
+                    
+                    processed += 1
+                    print(f"\n[{processed}/{len(pending_groups)}] Обработано: {link_info['display_name']}")
+                    
+                    if saved_path == NOT_MODIFIED:
+                        # Файлы ячеек остаются прежними
+                        unchanged_downloads += len(duplicates) + 1
+                    elif saved_path:
+                        successful_downloads += 1
+                        # Новое содержимое занимает место файла из прошлого запуска
+                        saved_path = replace_previous_file(manifest, link_info, saved_path, pictures_dir)
+                        manifest[link_info['display_name']] = {
+                            'url': link_info['url'], 'file': os.path.basename(saved_path), 'status': 'done'
+                        }
+                        for duplicate in duplicates:
+                            remove_previous_file(manifest, duplicate, pictures_dir)
+                            duplicate_path = link_or_copy_file(saved_path, duplicate['display_name'], pictures_dir)
+                            print(f"  ✓ Повтор {duplicate['display_name']}: {os.path.basename(duplicate_path)}")
+                            successful_downloads += 1
+                            manifest[duplicate['display_name']] = {
+                                'url': duplicate['url'], 'file': os.path.basename(duplicate_path), 'status': 'done'
+                            }
+                    elif revalidate:
+                        # Проверка не удалась (например, временная ошибка сервера) —
+                        # скачанные ранее файлы и записи манифеста остаются как есть
+                        print(f"  ⚠️  Не удалось проверить, оставляю прежний файл")
+                        kept_downloads += len(duplicates) + 1
+                    else:
+                        for failed_link in [link_info] + duplicates:
+                            failed_downloads += 1
+                            remove_previous_file(manifest, failed_link, pictures_dir)
+                            placeholder_path = log_download_error(failed_link['display_name'], failed_link['url'], error_file_path, pictures_dir)
+                            manifest[failed_link['display_name']] = {
+                                'url': failed_link['url'],
+                                'file': os.path.basename(placeholder_path) if placeholder_path else None,
+                                'status': 'error'
+                            }
+                    
+                    # Периодически сохраняем прогресс, чтобы прерванный запуск можно было продолжить
+                    if processed % MANIFEST_SAVE_INTERVAL == 0:
+                        save_download_manifest(pictures_dir, manifest)
+    finally:
+        converter.shutdown()
+        save_download_manifest(pictures_dir, manifest)
+        write_error_file(error_file_path, manifest)
+        # Старые версии изменившихся изображений больше ни на что не ссылаются
+        unused_count, unused_bytes = media_store.remove_unused_files(pictures_dir)
+        if unused_count:
+            print(f"\nУдалено неиспользуемых файлов хранилища: {unused_count} "
+                  f"({unused_bytes / 1024 / 1024:.1f} МБ)")
     
     print(f"\n=== РЕЗУЛЬТАТЫ СКАЧИВАНИЯ ===")
     print(f"Успешно скачано и конвертировано: {successful_downloads}")
+    if unchanged_downloads:
+        print(f"Не изменилось на сервере: {unchanged_downloads}")
+    if skipped_downloads:
+        print(f"Пропущено (скачано ранее): {skipped_downloads}")
+    if kept_downloads:
+        print(f"Не удалось проверить (оставлены прежние файлы): {kept_downloads}")
     print(f"Ошибок скачивания: {failed_downloads}")
+    store_stats = media_store.get_stats()
+    if store_stats['reused']:
+        print(f"Одинаковое содержимое по разным ссылкам: {store_stats['reused']} "
+              f"(сэкономлено {store_stats['bytes_saved'] / 1024 / 1024:.1f} МБ)")
     print(f"Всего обработано: {len(image_links)}")
     
-    if failed_downloads > 0:
+    if os.path.exists(error_file_path):
         print(f"\nОшибки сохранены в файл: {error_file_path}")
     
     print(f"\nИзображения сохранены в JPG формате в: {pictures_dir}")
@@ -1,14 +1,19 @@
 import os
 import yt_dlp
 import yt_dlp.utils
-import requests
-import re
+import http_client
 import urllib.parse
 import json
 import time
 import subprocess
 import sys
 from datetime import datetime
+from bandwidth_limiter import get_bandwidth_limiter
+from link_dedup import group_duplicate_links, link_or_copy_file
+from link_files import choose_links_file, sanitize_filename, read_removed_links, remove_cell_files
+from redirect_resolver import is_short_link, resolve_short_link
+from retry_policy import call_with_retry, is_retryable_message
+from url_classifier import classify_url, UNKNOWN_PLATFORM
 
 def check_and_install_dependencies():
     """Проверяет и устанавливает необходимые зависимости"""
@@ -65,13 +70,12 @@ def update_yt_dlp():
 def check_tor_connection(port=9150):
     """Проверяет подключение к Tor"""
     try:
-        import requests
         proxies = {
             'http': f'socks5h://127.0.0.1:{port}',
             'https': f'socks5h://127.0.0.1:{port}'
         }
         
-        response = requests.get('https://check.torproject.org/', proxies=proxies, timeout=15)
+        response = http_client.get('https://check.torproject.org/', proxies=proxies, timeout=15)
         if 'Congratulations' in response.text:
             print(f"✓ Tor работает на порту {port}")
             return True
@@ -181,107 +185,11 @@ def get_project_name():
 
 def get_platform_info(url):
     """Определяет платформу видео и возвращает информацию о ней"""
-    # Специальная проверка для Yandex видео
-    if 'yandex.ru/video' in url:
-        return 'Yandex Video'
-    
-    # Специальная проверка для Megabook видео
-    if 'megabook.ru/stream' in url:
-        return 'Megabook Video'
-    
-    # Специальная проверка для Dzen видео
-    if 'dzen.ru' in url and ('video' in url or 'media' in url):
-        return 'Dzen Video'
-    
-    platform_info = {
-        'youtube.com': 'YouTube',
-        'youtu.be': 'YouTube',
-        'vimeo.com': 'Vimeo',
-        'dailymotion.com': 'Dailymotion',
-        'twitch.tv': 'Twitch',
-        'facebook.com': 'Facebook',
-        'instagram.com': 'Instagram',
-        'tiktok.com': 'TikTok',
-        'reddit.com': 'Reddit',
-        'twitter.com': 'Twitter/X',
-        'x.com': 'Twitter/X',
-        'bilibili.com': 'Bilibili',
-        'rutube.ru': 'Rutube',
-        'vk.com': 'VKontakte',
-        'ok.ru': 'Odnoklassniki',
-        'mail.ru': 'Mail.ru',
-        'yandex.ru': 'Yandex',
-        'pinterest.com': 'Pinterest',
-        'linkedin.com': 'LinkedIn',
-        'snapchat.com': 'Snapchat',
-        'telegram.org': 'Telegram',
-        'discord.com': 'Discord',
-        'zoom.us': 'Zoom',
-        'teams.microsoft.com': 'Microsoft Teams',
-        'webex.com': 'Cisco Webex',
-        'kick.com': 'Kick',
-        'rumble.com': 'Rumble',
-        'odysee.com': 'Odysee',
-        'lbry.tv': 'LBRY',
-        'peertube.fr': 'PeerTube',
-        'peertube.org': 'PeerTube',
-        'invidious.io': 'Invidious',
-        'invidious.snopyta.org': 'Invidious',
-        'nicovideo.jp': 'Niconico',
-        'niconico.jp': 'Niconico',
-        'youku.com': 'Youku',
-        'iqiyi.com': 'iQiyi',
-        'tencent.com': 'Tencent',
-        'qq.com': 'QQ',
-        'weibo.com': 'Weibo',
-        'douyin.com': 'Douyin',
-        'dzen.ru': 'Dzen',
-        'megabook.ru': 'Megabook'
-    }
-    
-    for domain, platform in platform_info.items():
-        if domain in url:
-            return platform
-    return 'Unknown Platform'
+    return classify_url(url)['platform'] or UNKNOWN_PLATFORM
 
 def is_video_url(url):
     """Проверяет, является ли ссылка видео ссылкой"""
-    # Специальная проверка для Yandex видео
-    if 'yandex.ru/video' in url:
-        return True
-    
-    # Специальная проверка для Megabook видео
-    if 'megabook.ru/stream' in url:
-        return True
-    
-    # Специальная проверка для Dzen видео
-    if 'dzen.ru' in url and ('video' in url or 'media' in url):
-        return True
-    
-    # Расширенная проверка для различных видео платформ
-    video_domains = [
-        # Основные видео платформы
-        'youtube.com', 'youtu.be', 'vimeo.com', 'dailymotion.com', 
-        'twitch.tv', 'facebook.com', 'instagram.com', 'tiktok.com',
-        'reddit.com', 'twitter.com', 'x.com', 'bilibili.com',
-        
-        # Дополнительные платформы
-        'rutube.ru', 'vk.com', 'ok.ru', 'mail.ru', 'yandex.ru',
-        'pinterest.com', 'linkedin.com', 'snapchat.com', 'telegram.org',
-        'discord.com', 'zoom.us', 'teams.microsoft.com', 'webex.com',
-        
-        # Стриминговые платформы
-        'kick.com', 'rumble.com', 'odysee.com', 'lbry.tv',
-        'peertube.fr', 'peertube.org', 'invidious.io', 'invidious.snopyta.org',
-        
-        # Азиатские платформы
-        'nicovideo.jp', 'niconico.jp', 'youku.com', 'iqiyi.com',
-        'tencent.com', 'qq.com', 'weibo.com', 'douyin.com',
-        
-        # Российские платформы
-        'dzen.ru', 'megabook.ru'
-    ]
-    return any(domain in url for domain in video_domains)
+    return classify_url(url)['platform'] is not None
 
 def get_video_title(url):
     """Получает название видео"""
@@ -299,30 +207,22 @@ def get_video_title(url):
         print(f"  ⚠️  Не удалось получить название видео: {e}")
         return 'Unknown Title'
 
-def sanitize_filename(filename):
-    """Очищает имя файла от недопустимых символов"""
-    # Заменяем недопустимые символы на подчеркивание
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    
-    # Убираем лишние пробелы и подчеркивания
-    filename = re.sub(r'\s+', '_', filename)
-    filename = re.sub(r'_+', '_', filename)
-    
-    return filename.strip('_')
-
 def download_video(url, display_name, download_dir, error_file_path, tor_port=None):
     """Скачивает видео"""
     try:
         print(f"Скачиваю: {display_name}")
         
+        # Короткие ссылки разворачиваем, чтобы правильно определить платформу
+        resolved_url = resolve_short_link(url)
+        if resolved_url != url:
+            print(f"  📍 Конечный адрес короткой ссылки: {resolved_url}")
+        
         # Определяем платформу
-        platform = get_platform_info(url)
+        platform = get_platform_info(resolved_url)
         print(f"  🌐 Платформа: {platform}")
         
         # Получаем название видео
-        video_title = get_video_title(url)
+        video_title = get_video_title(resolved_url)
         print(f"  📺 Название видео: {video_title}")
         
         # Создаем имя файла: {display_name}_{video_title}
@@ -357,8 +257,11 @@ def download_video(url, display_name, download_dir, error_file_path, tor_port=No
         else:
             print(f"  ⚠️  Скачиваю без Tor прокси")
         
+        # Общий с другими скриптами лимит скорости (BANDWIDTH_LIMIT_KBPS)
+        get_bandwidth_limiter('other_video').apply_to_ydl_opts(ydl_opts)
+        
         # Специальные настройки для разных платформ
-        if 'yandex.ru' in url:
+        if platform in ('Yandex', 'Yandex Video'):
             # Для Yandex видео добавляем дополнительные заголовки
             ydl_opts['http_headers'] = {
                 'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -371,9 +274,13 @@ def download_video(url, display_name, download_dir, error_file_path, tor_port=No
             }
             print(f"  🔧 Применяю специальные настройки для Yandex")
         
-        try:
+        def run_download():
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+                ydl.download([resolved_url])
+        
+        try:
+            # 429, 503 и обрывы соединения повторяем с паузой, см. retry_policy
+            call_with_retry(run_download, resolved_url, is_retryable=is_retryable_message)
             
             print(f"  ✓ Видео успешно скачано")
             return True, video_title
@@ -384,8 +291,7 @@ def download_video(url, display_name, download_dir, error_file_path, tor_port=No
                 print(f"  🔄 Повторная попытка без Tor прокси...")
                 ydl_opts.pop('proxy', None)
                 try:
-                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                        ydl.download([url])
+                    call_with_retry(run_download, resolved_url, is_retryable=is_retryable_message)
                     print(f"  ✓ Видео успешно скачано (без Tor)")
                     return True, video_title
                 except Exception as e2:
@@ -402,6 +308,14 @@ def download_video(url, display_name, download_dir, error_file_path, tor_port=No
         log_video_error(display_name, url, video_title, error_file_path)
         return False, video_title
 
+def find_downloaded_video(download_dir, display_name, video_title):
+    """Находит файл, который yt-dlp сохранил для ячейки"""
+    prefix = f"{display_name}_{sanitize_filename(video_title)}."
+    for filename in sorted(os.listdir(download_dir)):
+        if filename.startswith(prefix) and not filename.endswith(('.part', '.ytdl')):
+            return os.path.join(download_dir, filename)
+    return None
+
 def read_video_links(video_links_file):
     """Читает ссылки на видео из файла"""
     links = []
@@ -420,8 +334,8 @@ def read_video_links(video_links_file):
                 display_name = parts[0].strip()
                 url = parts[1].strip()
                 
-                # Проверяем, что это видео ссылка
-                if is_video_url(url):
+                # Проверяем, что это видео ссылка (короткие ссылки разрешаются при скачивании)
+                if is_video_url(url) or is_short_link(url):
                     links.append({
                         'display_name': display_name,
                         'url': url
@@ -519,7 +433,7 @@ def main():
     os.makedirs(video_dir, exist_ok=True)
     
     # Путь к файлу с ссылками на видео
-    video_links_file = os.path.join(parse_links_dir, 'video_links.txt')
+    video_links_file = choose_links_file(parse_links_dir, 'video')
     
     # Путь к файлу ошибок
     error_file_path = os.path.join(video_dir, 'video_download_errors.txt')
@@ -537,6 +451,11 @@ def main():
     else:
         print("Видео будут скачиваться напрямую (без Tor)")
     
+    # Видео ячеек, удаленных из таблицы с прошлого парсинга, больше не нужны
+    removed_count = remove_cell_files(video_dir, read_removed_links(parse_links_dir))
+    if removed_count:
+        print(f"Удалено файлов ячеек, которых больше нет в таблице: {removed_count}")
+    
     # Читаем ссылки на видео
     video_links = read_video_links(video_links_file)
     
@@ -550,8 +469,14 @@ def main():
     successful_downloads = 0
     failed_downloads = 0
     
-    for i, link_info in enumerate(video_links, 1):
-        print(f"\n[{i}/{len(video_links)}] Обрабатываю: {link_info['display_name']}")
+    # Одно и то же видео из разных ячеек скачиваем один раз
+    link_groups = group_duplicate_links(video_links)
+    duplicate_count = len(video_links) - len(link_groups)
+    if duplicate_count:
+        print(f"Повторяющихся ссылок: {duplicate_count} (будут скачаны один раз)")
+    
+    for i, (link_info, duplicates) in enumerate(link_groups, 1):
+        print(f"\n[{i}/{len(link_groups)}] Обрабатываю: {link_info['display_name']}")
         
         success, video_title = download_video(
             link_info['url'], 
@@ -563,8 +488,22 @@ def main():
         
         if success:
             successful_downloads += 1
+            video_path = find_downloaded_video(video_dir, link_info['display_name'], video_title)
+            for duplicate in duplicates:
+                if video_path:
+                    target_name = f"{duplicate['display_name']}_{sanitize_filename(video_title)}"
+                    duplicate_path = link_or_copy_file(video_path, target_name, video_dir)
+                    print(f"  ✓ Повтор {duplicate['display_name']}: {os.path.basename(duplicate_path)}")
+                    successful_downloads += 1
+                else:
+                    print(f"  ⚠️  Не найден скачанный файл для повтора {duplicate['display_name']}")
+                    log_video_error(duplicate['display_name'], duplicate['url'], video_title, error_file_path)
+                    failed_downloads += 1
         else:
             failed_downloads += 1
+            for duplicate in duplicates:
+                log_video_error(duplicate['display_name'], duplicate['url'], video_title, error_file_path)
+                failed_downloads += 1
         
         # Небольшая пауза между запросами
         time.sleep(1)
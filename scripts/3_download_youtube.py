@@ -1,13 +1,17 @@
 import os
 import yt_dlp
-import requests
-import re
+import http_client
 import urllib.parse
 import json
 import time
 import subprocess
 import sys
 from datetime import datetime
+from bandwidth_limiter import get_bandwidth_limiter
+from link_dedup import group_duplicate_links, link_or_copy_file
+from link_files import choose_links_file, sanitize_filename, read_removed_links, remove_cell_files
+from retry_policy import call_with_retry, is_retryable_message
+from url_classifier import classify_url
 
 def check_and_install_dependencies():
     """Проверяет и устанавливает необходимые зависимости"""
@@ -64,13 +68,12 @@ def update_yt_dlp():
 def check_tor_connection(port=9150):
     """Проверяет подключение к Tor"""
     try:
-        import requests
         proxies = {
             'http': f'socks5h://127.0.0.1:{port}',
             'https': f'socks5h://127.0.0.1:{port}'
         }
         
-        response = requests.get('https://check.torproject.org/', proxies=proxies, timeout=15)
+        response = http_client.get('https://check.torproject.org/', proxies=proxies, timeout=15)
         if 'Congratulations' in response.text:
             print(f"✓ Tor работает на порту {port}")
             return True
@@ -180,7 +183,7 @@ def get_project_name():
 
 def is_youtube_url(url):
     """Проверяет, является ли ссылка YouTube ссылкой"""
-    return 'youtube.com' in url or 'youtu.be' in url
+    return classify_url(url)['category'] == 'youtube'
 
 def get_video_title(url):
     """Получает название видео с YouTube"""
@@ -198,19 +201,6 @@ def get_video_title(url):
         print(f"  ⚠️  Не удалось получить название видео: {e}")
         return 'Unknown Title'
 
-def sanitize_filename(filename):
-    """Очищает имя файла от недопустимых символов"""
-    # Заменяем недопустимые символы на подчеркивание
-    invalid_chars = '<>:"/\\|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
-    
-    # Убираем лишние пробелы и подчеркивания
-    filename = re.sub(r'\s+', '_', filename)
-    filename = re.sub(r'_+', '_', filename)
-    
-    return filename.strip('_')
-
 def download_youtube_video(url, display_name, download_dir, error_file_path, tor_port=None):
     """Скачивает YouTube видео"""
     try:
@@ -242,8 +232,15 @@ def download_youtube_video(url, display_name, download_dir, error_file_path, tor
         else:
             print(f"  ⚠️  Скачиваю без Tor прокси")
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+        # Общий с другими скриптами лимит скорости (BANDWIDTH_LIMIT_KBPS)
+        get_bandwidth_limiter('youtube').apply_to_ydl_opts(ydl_opts)
+        
+        def run_download():
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                ydl.download([url])
+        
+        # 429, 503 и обрывы соединения повторяем с паузой, см. retry_policy
+        call_with_retry(run_download, url, is_retryable=is_retryable_message)
         
         print(f"  ✓ Видео успешно скачано")
         return True, video_title
@@ -256,6 +253,14 @@ def download_youtube_video(url, display_name, download_dir, error_file_path, tor
         log_youtube_error(display_name, url, video_title, error_file_path)
         return False, video_title
 
+def find_downloaded_video(download_dir, display_name, video_title):
+    """Находит файл, который yt-dlp сохранил для ячейки"""
+    prefix = f"{display_name}_{sanitize_filename(video_title)}."
+    for filename in sorted(os.listdir(download_dir)):
+        if filename.startswith(prefix) and not filename.endswith(('.part', '.ytdl')):
+            return os.path.join(download_dir, filename)
+    return None
+
 def read_youtube_links(youtube_links_file):
     """Читает ссылки на YouTube видео из файла"""
     links = []
@@ -373,7 +378,7 @@ def main():
     os.makedirs(youtube_dir, exist_ok=True)
     
     # Путь к файлу с ссылками на YouTube видео
-    youtube_links_file = os.path.join(parse_links_dir, 'youtube_links.txt')
+    youtube_links_file = choose_links_file(parse_links_dir, 'youtube')
     
     # Путь к файлу ошибок
     error_file_path = os.path.join(youtube_dir, 'youtube_download_errors.txt')
@@ -391,6 +396,11 @@ def main():
     else:
         print("Видео будут скачиваться напрямую (без Tor)")
     
+    # Видео ячеек, удаленных из таблицы с прошлого парсинга, больше не нужны
+    removed_count = remove_cell_files(youtube_dir, read_removed_links(parse_links_dir))
+    if removed_count:
+        print(f"Удалено файлов ячеек, которых больше нет в таблице: {removed_count}")
+    
     # Читаем ссылки на YouTube видео
     youtube_links = read_youtube_links(youtube_links_file)
     
@@ -404,8 +414,14 @@ def main():
     successful_downloads = 0
     failed_downloads = 0
     
-    for i, link_info in enumerate(youtube_links, 1):
-        print(f"\n[{i}/{len(youtube_links)}] Обрабатываю: {link_info['display_name']}")
+    # Одно и то же видео из разных ячеек скачиваем один раз
+    link_groups = group_duplicate_links(youtube_links)
+    duplicate_count = len(youtube_links) - len(link_groups)
+    if duplicate_count:
+        print(f"Повторяющихся ссылок: {duplicate_count} (будут скачаны один раз)")
+    
+    for i, (link_info, duplicates) in enumerate(link_groups, 1):
+        print(f"\n[{i}/{len(link_groups)}] Обрабатываю: {link_info['display_name']}")
         
         success, video_title = download_youtube_video(
             link_info['url'], 
@@ -417,8 +433,22 @@ def main():
         
         if success:
             successful_downloads += 1
+            video_path = find_downloaded_video(youtube_dir, link_info['display_name'], video_title)
+            for duplicate in duplicates:
+                if video_path:
+                    target_name = f"{duplicate['display_name']}_{sanitize_filename(video_title)}"
+                    duplicate_path = link_or_copy_file(video_path, target_name, youtube_dir)
+                    print(f"  ✓ Повтор {duplicate['display_name']}: {os.path.basename(duplicate_path)}")
+                    successful_downloads += 1
+                else:
+                    print(f"  ⚠️  Не найден скачанный файл для повтора {duplicate['display_name']}")
+                    log_youtube_error(duplicate['display_name'], duplicate['url'], video_title, error_file_path)
+                    failed_downloads += 1
         else:
             failed_downloads += 1
+            for duplicate in duplicates:
+                log_youtube_error(duplicate['display_name'], duplicate['url'], video_title, error_file_path)
+                failed_downloads += 1
         
         # Небольшая пауза между запросами
         time.sleep(1)
@@ -0,0 +1,149 @@
+"""
+Общее ограничение скорости скачивания (token bucket).
+Все скрипты, запущенные одновременно, берут байты из общих «ведер» токенов,
+состояние которых хранится в файле ~/Downloads/download_all/.bandwidth_state.json
+под блокировкой flock. Ведро global ограничивает суммарную скорость всех
+скриптов, ведро этапа (images, youtube, other_video) — скорость одного этапа.
+Скачивание, которому не хватило токенов, уходит в долг и ждет, пока ведро
+наполнится, поэтому суммарная скорость не превышает лимит, как бы ни было
+много потоков и процессов.
+
+Настройки (переменные окружения), в килобайтах в секунду, 0 — без ограничения:
+    BANDWIDTH_LIMIT_KBPS              — суммарно для всех скриптов (по умолчанию 0)
+    BANDWIDTH_LIMIT_IMAGES_KBPS       — для 2_download_img.py
+    BANDWIDTH_LIMIT_YOUTUBE_KBPS      — для 3_download_youtube.py
+    BANDWIDTH_LIMIT_OTHER_VIDEO_KBPS  — для 3.1_download_other_video.py
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: ограничение действует только внутри одного процесса
+    fcntl = None
+
+import http_client
+
+STATE_FILENAME = '.bandwidth_state.json'
+GLOBAL_BUCKET = 'global'
+# Сколько секунд скорости можно потратить разом после простоя
+BURST_SECONDS = 1.0
+
+
+def get_state_path():
+    """Файл состояния в общей для всех скриптов директории download_all"""
+    download_all_dir = os.path.join(os.path.expanduser('~/Downloads'), 'download_all')
+    os.makedirs(download_all_dir, exist_ok=True)
+    return os.path.join(download_all_dir, STATE_FILENAME)
+
+
+def get_rate_setting(name):
+    """Читает лимит в КБ/с и возвращает его в байтах в секунду (0 — без ограничения)"""
+    return max(0, http_client.get_int_setting(name, 0)) * 1024
+
+
+class BandwidthLimiter:
+    """Ведра токенов global и этапа stage, общие для всех процессов"""
+
+    def __init__(self, state_path, global_rate, stage, stage_rate):
+        self.state_path = state_path
+        self.rates = {}
+        if global_rate:
+            self.rates[GLOBAL_BUCKET] = global_rate
+        if stage_rate:
+            self.rates[stage] = stage_rate
+        self.lock = threading.Lock()
+        self.progress = {}
+
+    def get_ratelimit(self):
+        """Наименьший из лимитов в байтах в секунду или None — для опции ratelimit yt-dlp"""
+        return min(self.rates.values()) if self.rates else None
+
+    def reserve(self, nbytes):
+        """Списывает nbytes из ведер и возвращает, сколько секунд нужно подождать"""
+        with self.lock, open(self.state_path, 'a+', encoding='utf-8') as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                # Файл поврежден — начинаем с полных ведер
+                state = {}
+
+            now = time.time()
+            wait = 0.0
+            for name, rate in self.rates.items():
+                capacity = rate * BURST_SECONDS
+                bucket = state.get(name) or {'tokens': capacity, 'updated': now}
+                elapsed = max(0.0, now - bucket['updated'])
+                tokens = min(capacity, bucket['tokens'] + elapsed * rate) - nbytes
+                state[name] = {'tokens': tokens, 'updated': now}
+                if tokens < 0:
+                    wait = max(wait, -tokens / rate)
+
+            f.seek(0)
+            f.truncate()
+            json.dump(state, f)
+            f.flush()
+        return wait
+
+    def consume(self, nbytes):
+        """Ждет, пока скорость позволит передать nbytes"""
+        if not self.rates or nbytes <= 0:
+            return
+        wait = self.reserve(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+
+    def progress_hook(self, progress):
+        """
+        Хук прогресса для yt-dlp (опция progress_hooks): списывает байты,
+        скачанные с прошлого вызова, и задерживает загрузчик, если лимит превышен
+        """
+        key = progress.get('filename')
+        downloaded = progress.get('downloaded_bytes') or 0
+        if progress.get('status') != 'downloading':
+            with self.lock:
+                self.progress.pop(key, None)
+            return
+        with self.lock:
+            previous = self.progress.get(key, 0)
+            self.progress[key] = downloaded
+        # Счетчик начался заново (следующий фрагмент или повтор) — считаем от нуля
+        self.consume(downloaded - previous if downloaded >= previous else downloaded)
+
+    def apply_to_ydl_opts(self, ydl_opts):
+        """Добавляет ограничение скорости в опции yt-dlp"""
+        if not self.rates:
+            return ydl_opts
+        # ratelimit ограничивает этот процесс, хук — общую скорость со всеми скриптами
+        ydl_opts['ratelimit'] = self.get_ratelimit()
+        ydl_opts.setdefault('progress_hooks', []).append(self.progress_hook)
+        return ydl_opts
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_bandwidth_limiter(stage):
+    """
+    Возвращает общий для всех потоков BandwidthLimiter этапа stage.
+    Лимиты берутся из BANDWIDTH_LIMIT_KBPS и BANDWIDTH_LIMIT_<STAGE>_KBPS.
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(stage)
+        if limiter is None:
+            limiter = BandwidthLimiter(
+                get_state_path(),
+                get_rate_setting('BANDWIDTH_LIMIT_KBPS'),
+                stage,
+                get_rate_setting(f'BANDWIDTH_LIMIT_{stage.upper()}_KBPS'),
+            )
+            _limiters[stage] = limiter
+    return limiter
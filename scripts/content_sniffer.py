@@ -0,0 +1,69 @@
+"""
+Определение типа файла по первым байтам (сигнатурам).
+Используется, когда сервер не отвечает на HEAD или присылает неверный content-type.
+"""
+
+# Сколько байт запрашивать для определения типа
+SNIFF_BYTES = 4096
+
+HLS_MIME_TYPE = 'application/vnd.apple.mpegurl'
+
+# Бренды ISO BMFF (ftyp), которые означают изображение, а не видео
+IMAGE_FTYP_BRANDS = {
+    b'avif': 'image/avif',
+    b'avis': 'image/avif',
+    b'heic': 'image/heic',
+    b'heix': 'image/heic',
+    b'mif1': 'image/heif',
+    b'msf1': 'image/heif',
+}
+
+
+def sniff_content_type(data):
+    """
+    Определяет MIME-тип по сигнатуре в начале файла.
+
+    Returns:
+        str: MIME-тип (например, 'image/jpeg', 'video/mp4') или None
+    """
+    if not data:
+        return None
+
+    if data.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if data.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+
+    # MP4/MOV и изображения AVIF/HEIC: "....ftyp<бренд>"
+    if data[4:8] == b'ftyp':
+        brand = data[8:12]
+        if brand in IMAGE_FTYP_BRANDS:
+            return IMAGE_FTYP_BRANDS[brand]
+        if brand == b'qt  ':
+            return 'video/quicktime'
+        return 'video/mp4'
+
+    # WebM и Matroska начинаются с заголовка EBML
+    if data.startswith(b'\x1a\x45\xdf\xa3'):
+        return 'video/webm' if b'webm' in data[:64] else 'video/x-matroska'
+
+    # Плейлист HLS — текстовый файл, начинающийся с #EXTM3U
+    if data.lstrip(b'\xef\xbb\xbf \t\r\n').startswith(b'#EXTM3U'):
+        return HLS_MIME_TYPE
+
+    return None
+
+
+def get_category_from_mime_type(mime_type):
+    """Переводит MIME-тип в категорию ссылки: 'image', 'video' или None"""
+    if not mime_type:
+        return None
+    if mime_type.startswith('image/'):
+        return 'image'
+    if mime_type.startswith('video/') or mime_type == HLS_MIME_TYPE:
+        return 'video'
+    return None
@@ -0,0 +1,48 @@
+"""
+Ограничение одновременных запросов и частоты запросов к одному хосту.
+Используется параллельными загрузчиками вместо фиксированной паузы между
+запросами: разные хосты скачиваются параллельно, а к одному хосту уходит
+не больше заданного числа запросов одновременно и не чаще заданного интервала.
+"""
+
+import threading
+import time
+import urllib.parse
+from contextlib import contextmanager
+
+
+class HostLimiter:
+    """Семафор и минимальный интервал между началами запросов для каждого хоста"""
+
+    def __init__(self, per_host_limit, min_interval):
+        self.per_host_limit = max(1, per_host_limit)
+        self.min_interval = max(0.0, min_interval)
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.next_start = {}
+
+    def get_semaphore(self, host):
+        with self.lock:
+            semaphore = self.semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self.semaphores[host] = semaphore
+        return semaphore
+
+    def wait_for_turn(self, host):
+        """Ждет, пока с начала предыдущего запроса к хосту пройдет min_interval"""
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, 0.0))
+            self.next_start[host] = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+    @contextmanager
+    def slot(self, url):
+        """Занимает место для запроса к хосту url на время блока with"""
+        host = (urllib.parse.urlsplit(url).hostname or '').lower()
+        semaphore = self.get_semaphore(host)
+        with semaphore:
+            self.wait_for_turn(host)
+            yield
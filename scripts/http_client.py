@@ -0,0 +1,199 @@
+"""
+Общий HTTP-клиент для всех скриптов.
+Одна сессия с пулом keep-alive соединений на каждый хост, общие заголовки
+и таймауты. Повторные запросы к одному CDN переиспользуют соединения
+вместо нового TCP+TLS рукопожатия на каждый запрос.
+
+Настройки (переменные окружения):
+    HTTP_POOL_CONNECTIONS — сколько хостов держать в пуле (по умолчанию 32)
+    HTTP_POOL_MAXSIZE     — соединений на один хост (по умолчанию 16)
+    HTTP_TIMEOUT          — таймаут запроса в секундах (по умолчанию 10)
+    HTTP_ENABLE_HTTP2     — 1, чтобы использовать HTTP/2 (нужен пакет httpx[http2])
+"""
+
+import os
+import threading
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+DEFAULT_POOL_CONNECTIONS = 32
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_TIMEOUT = 10
+
+# Ответы на HEAD, после которых тот же адрес проверяется запросом GET:
+# часть серверов не поддерживает HEAD или отвечает на него ошибкой
+HEAD_UNSUPPORTED_STATUSES = {400, 403, 405, 406, 500, 501, 503}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_int_setting(name, default):
+    """Читает целочисленную настройку из переменных окружения"""
+    value = os.getenv(name, '').strip()
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        print(f"⚠️  Некорректное значение {name}={value}, использую {default}")
+        return default
+
+
+class HttpxRawStream:
+    """Обертка над потоковым ответом httpx, которую понимает requests.Response"""
+
+    def __init__(self, httpx_response):
+        self.httpx_response = httpx_response
+        self.iterator = None
+        self.buffer = b''
+
+    def stream(self, chunk_size=8192, decode_content=True):
+        import httpx
+
+        try:
+            if decode_content:
+                yield from self.httpx_response.iter_bytes(chunk_size)
+            else:
+                yield from self.httpx_response.iter_raw(chunk_size)
+        except httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e)
+        except httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e)
+
+    def read(self, amt=None, decode_content=True):
+        if self.iterator is None:
+            self.iterator = self.stream(amt or 65536, decode_content)
+        if amt is None:
+            data = self.buffer + b''.join(self.iterator)
+            self.buffer = b''
+            return data
+        while len(self.buffer) < amt:
+            chunk = next(self.iterator, None)
+            if chunk is None:
+                break
+            self.buffer += chunk
+        data, self.buffer = self.buffer[:amt], self.buffer[amt:]
+        return data
+
+    def close(self):
+        self.httpx_response.close()
+
+    def release_conn(self):
+        self.httpx_response.close()
+
+
+class Http2Adapter(BaseAdapter):
+    """Транспорт requests, отправляющий запросы через httpx с поддержкой HTTP/2"""
+
+    def __init__(self, pool_connections, pool_maxsize):
+        import httpx
+
+        super().__init__()
+        self.httpx = httpx
+        self.client = httpx.Client(
+            http2=True,
+            follow_redirects=False,
+            limits=httpx.Limits(
+                max_connections=pool_connections * pool_maxsize,
+                max_keepalive_connections=pool_connections * pool_maxsize
+            )
+        )
+        # Запросы через прокси (например, Tor) отправляются обычным транспортом
+        self.fallback = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        scheme = request.url.split(':', 1)[0].lower()
+        if proxies and (proxies.get(scheme) or proxies.get('all')):
+            return self.fallback.send(request, stream=stream, timeout=timeout,
+                                      verify=verify, cert=cert, proxies=proxies)
+
+        if isinstance(timeout, tuple):
+            connect_timeout, read_timeout = timeout
+            httpx_timeout = self.httpx.Timeout(read_timeout, connect=connect_timeout)
+        else:
+            httpx_timeout = self.httpx.Timeout(timeout)
+
+        httpx_request = self.client.build_request(
+            request.method, request.url,
+            headers=dict(request.headers), content=request.body,
+            extensions={'timeout': httpx_timeout.as_dict()}
+        )
+        try:
+            httpx_response = self.client.send(httpx_request, stream=True)
+        except self.httpx.TimeoutException as e:
+            raise requests.exceptions.Timeout(e, request=request)
+        except self.httpx.TransportError as e:
+            raise requests.exceptions.ConnectionError(e, request=request)
+
+        response = requests.Response()
+        response.status_code = httpx_response.status_code
+        response.reason = httpx_response.reason_phrase
+        response.headers = CaseInsensitiveDict(httpx_response.headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = HttpxRawStream(httpx_response)
+        response.url = str(httpx_response.url)
+        response.request = request
+        response.connection = self
+
+        if not stream:
+            response.content
+        return response
+
+    def close(self):
+        self.client.close()
+        self.fallback.close()
+
+
+def create_adapter(pool_connections, pool_maxsize):
+    """Создает транспорт: HTTP/2 через httpx, если он включен и установлен, иначе HTTP/1.1"""
+    if os.getenv('HTTP_ENABLE_HTTP2', '').strip() in ('1', 'true', 'yes'):
+        try:
+            import h2  # noqa: F401 — нужен httpx для HTTP/2
+            return Http2Adapter(pool_connections, pool_maxsize)
+        except ImportError:
+            print("⚠️  Для HTTP/2 нужен пакет httpx[http2], использую HTTP/1.1")
+
+    return HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+
+
+def get_session():
+    """Возвращает общую сессию, создавая ее при первом обращении"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            session.headers.update(DEFAULT_HEADERS)
+            adapter = create_adapter(
+                get_int_setting('HTTP_POOL_CONNECTIONS', DEFAULT_POOL_CONNECTIONS),
+                get_int_setting('HTTP_POOL_MAXSIZE', DEFAULT_POOL_MAXSIZE)
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+    return _session
+
+
+def request(method, url, **kwargs):
+    """Выполняет запрос через общую сессию с таймаутом по умолчанию"""
+    kwargs.setdefault('timeout', get_int_setting('HTTP_TIMEOUT', DEFAULT_TIMEOUT))
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    """GET-запрос через общую сессию"""
+    kwargs.setdefault('allow_redirects', True)
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    """HEAD-запрос через общую сессию"""
+    kwargs.setdefault('allow_redirects', True)
+    return request('HEAD', url, **kwargs)
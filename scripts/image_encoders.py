@@ -0,0 +1,141 @@
+"""
+Настраиваемые форматы сохранения заглушек (текстовые изображения и
+заглушки ошибок скачивания).
+
+Настройки (переменные окружения):
+    PLACEHOLDER_FORMAT      — jpeg (по умолчанию), png8, webp, webp-lossless
+    PLACEHOLDER_QUALITY     — качество JPEG/WebP или усилие сжатия WebP lossless (по умолчанию 95)
+    PLACEHOLDER_OPTIMIZE    — 1, чтобы включить дополнительную оптимизацию размера
+    PLACEHOLDER_PROGRESSIVE — 1, чтобы сохранять прогрессивный JPEG
+    PLACEHOLDER_COLORS      — количество цветов палитры для png8 (по умолчанию 16)
+
+Запуск модуля напрямую сравнивает форматы по скорости и размеру:
+    python scripts/image_encoders.py [директория с примерами изображений]
+"""
+
+import io
+import os
+import sys
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+import http_client
+
+FORMAT_EXTENSIONS = {
+    'jpeg': '.jpg',
+    'png8': '.png',
+    'webp': '.webp',
+    'webp-lossless': '.webp',
+}
+
+DEFAULT_FORMAT = 'jpeg'
+DEFAULT_QUALITY = 95
+DEFAULT_COLORS = 16
+
+
+def get_flag_setting(name):
+    """Читает логическую настройку из переменных окружения"""
+    return os.getenv(name, '').strip().lower() in ('1', 'true', 'yes')
+
+
+def get_output_settings():
+    """Возвращает настройки формата заглушек из переменных окружения"""
+    output_format = os.getenv('PLACEHOLDER_FORMAT', '').strip().lower() or DEFAULT_FORMAT
+    if output_format not in FORMAT_EXTENSIONS:
+        print(f"⚠️  Неизвестный формат PLACEHOLDER_FORMAT={output_format}, использую {DEFAULT_FORMAT}")
+        output_format = DEFAULT_FORMAT
+
+    return {
+        'format': output_format,
+        'quality': http_client.get_int_setting('PLACEHOLDER_QUALITY', DEFAULT_QUALITY),
+        'optimize': get_flag_setting('PLACEHOLDER_OPTIMIZE'),
+        'progressive': get_flag_setting('PLACEHOLDER_PROGRESSIVE'),
+        'colors': http_client.get_int_setting('PLACEHOLDER_COLORS', DEFAULT_COLORS),
+    }
+
+
+def get_extension(settings):
+    """Расширение файла для выбранного формата"""
+    return FORMAT_EXTENSIONS[settings['format']]
+
+
+def encode_image(image, output, settings):
+    """Сохраняет изображение в файл или поток в выбранном формате"""
+    output_format = settings['format']
+
+    if output_format == 'jpeg':
+        image.save(output, 'JPEG', quality=settings['quality'],
+                   optimize=settings['optimize'], progressive=settings['progressive'])
+    elif output_format == 'png8':
+        # Черный текст на белом фоне почти без потерь укладывается в маленькую палитру
+        palette_image = image.convert('RGB').quantize(colors=settings['colors'])
+        palette_image.save(output, 'PNG', optimize=settings['optimize'])
+    elif output_format == 'webp':
+        image.save(output, 'WEBP', quality=settings['quality'], method=6 if settings['optimize'] else 4)
+    elif output_format == 'webp-lossless':
+        image.save(output, 'WEBP', lossless=True, quality=settings['quality'],
+                   method=6 if settings['optimize'] else 4)
+
+
+def create_sample_corpus(count=20):
+    """Создает примеры текстовых заглушек для бенчмарка"""
+    try:
+        font = ImageFont.load_default(40)
+    except TypeError:
+        font = ImageFont.load_default()
+
+    words = "download error placeholder timeline scene interview archive footage".split()
+    images = []
+    for i in range(count):
+        image = Image.new('RGB', (1920, 1080), color='white')
+        draw = ImageDraw.Draw(image)
+        for line in range(i % 12 + 1):
+            text = ' '.join(words[(i + line + k) % len(words)] for k in range(8))
+            draw.text((100, 100 + line * 60), text, fill='black', font=font)
+        images.append(image)
+    return images
+
+
+def load_corpus(directory):
+    """Загружает изображения из директории для бенчмарка"""
+    images = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')):
+            with Image.open(os.path.join(directory, filename)) as image:
+                images.append(image.convert('RGB'))
+    return images
+
+
+def run_benchmark(images):
+    """Сравнивает форматы по времени кодирования и размеру файла"""
+    candidates = [
+        {'format': 'jpeg', 'quality': 95, 'optimize': False, 'progressive': False, 'colors': 16},
+        {'format': 'jpeg', 'quality': 85, 'optimize': True, 'progressive': True, 'colors': 16},
+        {'format': 'png8', 'quality': 95, 'optimize': False, 'progressive': False, 'colors': 16},
+        {'format': 'png8', 'quality': 95, 'optimize': True, 'progressive': False, 'colors': 16},
+        {'format': 'webp', 'quality': 90, 'optimize': False, 'progressive': False, 'colors': 16},
+        {'format': 'webp-lossless', 'quality': 50, 'optimize': False, 'progressive': False, 'colors': 16},
+    ]
+
+    print(f"=== БЕНЧМАРК ФОРМАТОВ ЗАГЛУШЕК ({len(images)} изображений) ===")
+    print(f"{'Формат':<16}{'Качество':>9}{'Оптим.':>8}{'мс/изобр.':>12}{'КБ/изобр.':>12}")
+    for settings in candidates:
+        total_bytes = 0
+        start = time.perf_counter()
+        for image in images:
+            buffer = io.BytesIO()
+            encode_image(image, buffer, settings)
+            total_bytes += buffer.tell()
+        elapsed = time.perf_counter() - start
+
+        print(f"{settings['format']:<16}{settings['quality']:>9}{'да' if settings['optimize'] else 'нет':>8}"
+              f"{elapsed / len(images) * 1000:>12.1f}{total_bytes / len(images) / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    corpus = load_corpus(sys.argv[1]) if len(sys.argv) > 1 else create_sample_corpus()
+    if not corpus:
+        print("❌ В директории не найдено изображений")
+    else:
+        run_benchmark(corpus)
@@ -0,0 +1,162 @@
+"""
+Канонизация ссылок и устранение повторных скачиваний.
+Ссылки на один и тот же ресурс (youtu.be/ID и youtube.com/watch?v=ID,
+с метками utm_* и без них, с www. и без) сводятся к одному ключу,
+ресурс скачивается один раз, а для остальных ячеек создаются жесткие ссылки.
+"""
+
+import os
+import re
+import shutil
+import urllib.parse
+
+from url_classifier import classify_url
+
+# Параметры отслеживания, которые не влияют на содержимое ресурса
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'yclid', 'ysclid', 'dclid', 'msclkid', 'igshid',
+    'mc_cid', 'mc_eid', '_openstat'
+}
+TRACKING_PARAM_PREFIXES = ('utm_',)
+
+# Параметры, которые не влияют на ресурс только на конкретных платформах
+# (на других хостах параметр с тем же именем может выбирать другой файл)
+PLATFORM_TRACKING_PARAMS = {
+    'YouTube': {'si', 'feature'},
+}
+
+# Префиксы хоста, которые не меняют ресурс
+HOST_PREFIXES = ('www.',)
+# Порты по умолчанию, которые не входят в ключ
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Мобильные версии сайтов отдают тот же ресурс только на этих платформах
+MOBILE_HOST_PREFIXES = ('m.', 'mobile.')
+MOBILE_HOST_PLATFORMS = {'YouTube', 'VKontakte', 'Facebook', 'Twitter/X', 'Odnoklassniki'}
+
+YOUTUBE_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{11}$')
+YOUTUBE_PATH_PATTERN = re.compile(r'^/(?:shorts|embed|live|v)/([A-Za-z0-9_-]{11})')
+VIMEO_PATH_PATTERN = re.compile(r'^/(?:video/)?(\d+)')
+RUTUBE_PATH_PATTERN = re.compile(r'^/(?:video|play/embed)/([0-9a-f]{32})')
+VK_VIDEO_PATTERN = re.compile(r'video(-?\d+_\d+)')
+
+
+def strip_host_prefix(host, platform=None):
+    """Убирает префикс www., а для платформ из MOBILE_HOST_PLATFORMS — и m./mobile."""
+    prefixes = HOST_PREFIXES
+    if platform in MOBILE_HOST_PLATFORMS:
+        prefixes += MOBILE_HOST_PREFIXES
+    for prefix in prefixes:
+        if host.startswith(prefix):
+            return host[len(prefix):]
+    return host
+
+
+def extract_video_id(parsed, platform):
+    """Возвращает ключ вида 'youtube:ID' для известных видео платформ или None"""
+    query = urllib.parse.parse_qs(parsed.query)
+
+    if platform == 'YouTube':
+        if parsed.hostname and parsed.hostname.endswith('youtu.be'):
+            video_id = parsed.path.strip('/').split('/')[0]
+        else:
+            video_id = query.get('v', [''])[0]
+            if not video_id:
+                match = YOUTUBE_PATH_PATTERN.match(parsed.path)
+                video_id = match.group(1) if match else ''
+        if YOUTUBE_ID_PATTERN.match(video_id):
+            return f"youtube:{video_id}"
+
+    elif platform == 'Vimeo':
+        match = VIMEO_PATH_PATTERN.match(parsed.path)
+        if match:
+            return f"vimeo:{match.group(1)}"
+
+    elif platform == 'Rutube':
+        match = RUTUBE_PATH_PATTERN.match(parsed.path)
+        if match:
+            return f"rutube:{match.group(1)}"
+
+    elif platform == 'VKontakte':
+        # Видео открывается как /video-1_2 или как параметр z=video-1_2
+        match = VK_VIDEO_PATTERN.search(parsed.path) or VK_VIDEO_PATTERN.search(query.get('z', [''])[0])
+        if match:
+            return f"vk:{match.group(1)}"
+
+    return None
+
+
+def canonicalize_url(url):
+    """
+    Возвращает канонический ключ ссылки.
+    Для видео известных платформ — идентификатор видео, для остальных —
+    URL без схемы, префиксов хоста, меток отслеживания и фрагмента.
+    """
+    url = url.strip()
+    try:
+        parsed = urllib.parse.urlsplit(url)
+    except ValueError:
+        return url
+
+    platform = classify_url(url)['platform']
+    video_key = extract_video_id(parsed, platform)
+    if video_key:
+        return video_key
+
+    host = strip_host_prefix((parsed.hostname or '').lower(), platform)
+    try:
+        port = parsed.port
+    except ValueError:
+        return url
+    if port and port != DEFAULT_PORTS.get(parsed.scheme.lower()):
+        # Другой порт — другой сервер
+        host += f':{port}'
+    tracking_params = TRACKING_PARAMS | PLATFORM_TRACKING_PARAMS.get(platform, set())
+    query = [
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(parsed.query, keep_blank_values=True)
+        if name.lower() not in tracking_params and not name.lower().startswith(TRACKING_PARAM_PREFIXES)
+    ]
+    # Завершающий / не убираем: /dir/ и /dir могут быть разными ресурсами
+    path = parsed.path or '/'
+
+    canonical = host + path
+    if query:
+        canonical += '?' + urllib.parse.urlencode(query)
+    return canonical
+
+
+def group_duplicate_links(links):
+    """
+    Группирует ссылки по каноническому ключу с сохранением порядка.
+    Возвращает список (первая ссылка, [повторы]).
+    """
+    groups = {}
+    for link_info in links:
+        key = canonicalize_url(link_info['url'])
+        if key in groups:
+            groups[key][1].append(link_info)
+        else:
+            groups[key] = (link_info, [])
+    return list(groups.values())
+
+
+def link_or_copy_file(source_path, target_name, download_dir):
+    """
+    Создает для повторяющейся ячейки жесткую ссылку на уже скачанный файл
+    (или копию, если жесткие ссылки не поддерживаются). Расширение берется
+    из исходного файла. Возвращает путь к созданному файлу.
+    """
+    extension = os.path.splitext(source_path)[1]
+    target_path = os.path.join(download_dir, target_name + extension)
+
+    # Проверяем, не существует ли уже файл с таким именем
+    counter = 1
+    while os.path.exists(target_path):
+        target_path = os.path.join(download_dir, f"{target_name}_{counter}{extension}")
+        counter += 1
+
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copy2(source_path, target_path)
+    return target_path
@@ -0,0 +1,75 @@
+"""
+Общие функции для файлов ссылок, которые 1_parse_links.py оставляет в
+директории 1_parse_links: выбор между полным списком и файлом изменений,
+чтение removed_links.txt и удаление файлов ячеек, исчезнувших из таблицы,
+а также очистка имен файлов, которые строятся из названий ячеек и видео.
+"""
+
+import os
+import re
+
+REMOVED_LINKS_FILENAME = 'removed_links.txt'
+
+
+def sanitize_filename(filename):
+    """Очищает имя файла от недопустимых символов"""
+    # Заменяем недопустимые символы на подчеркивание
+    invalid_chars = '<>:"/\\|?*'
+    for char in invalid_chars:
+        filename = filename.replace(char, '_')
+
+    # Убираем лишние пробелы и подчеркивания
+    filename = re.sub(r'\s+', '_', filename)
+    filename = re.sub(r'_+', '_', filename)
+
+    return filename.strip('_')
+
+
+def choose_links_file(parse_links_dir, category):
+    """Предлагает скачать только новые и измененные ссылки, если есть файл изменений"""
+    links_file = os.path.join(parse_links_dir, f'{category}_links.txt')
+    delta_file = os.path.join(parse_links_dir, f'{category}_links_delta.txt')
+
+    if os.path.exists(delta_file):
+        print(f"\nНайден файл изменений с прошлого парсинга: {os.path.basename(delta_file)}")
+        answer = input('Скачать только новые и измененные ссылки? (y/n): ').strip().lower()
+        if answer in ('y', 'yes', 'д', 'да'):
+            return delta_file
+
+    return links_file
+
+
+def read_removed_links(parse_links_dir):
+    """Читает removed_links.txt; возвращает пустой список, если удаленных ссылок нет"""
+    removed_links_file = os.path.join(parse_links_dir, REMOVED_LINKS_FILENAME)
+    links = []
+    if not os.path.exists(removed_links_file):
+        return links
+
+    with open(removed_links_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            # Строка формата "A1 1 : https://example.com"
+            parts = line.strip().split(' : ', 1)
+            if len(parts) == 2:
+                links.append({'display_name': parts[0].strip(), 'url': parts[1].strip()})
+    return links
+
+
+def remove_cell_files(download_dir, removed_links):
+    """
+    Удаляет файлы видео, скачанные для исчезнувших из таблицы ячеек.
+    Видео сохраняются как "{display_name}_{название}.ext", поэтому файлы ячейки
+    находятся по префиксу имени. Возвращает количество удаленных файлов.
+    """
+    if not removed_links or not os.path.isdir(download_dir):
+        return 0
+
+    prefixes = tuple(f"{link_info['display_name']}_" for link_info in removed_links)
+    removed_count = 0
+    for filename in os.listdir(download_dir):
+        if filename.startswith(prefixes):
+            os.remove(os.path.join(download_dir, filename))
+            removed_count += 1
+    return removed_count
@@ -0,0 +1,117 @@
+"""
+Хранилище файлов по содержимому.
+Каждый уникальный файл хранится один раз под именем <sha256>.<расширение>
+в скрытой директории рядом с результатами, а файлы ячеек создаются как
+жесткие ссылки на него. Одинаковые изображения с разных адресов (зеркала
+CDN, одинаково отдаваемые варианты) занимают место и конвертируются один раз.
+"""
+
+import os
+import threading
+import uuid
+
+STORE_DIRNAME = '.media_store'
+
+_stats = {'stored': 0, 'reused': 0, 'bytes_saved': 0}
+_stats_lock = threading.Lock()
+
+
+def get_store_path(download_dir, digest, extension):
+    """Путь к файлу хранилища для содержимого с данным хэшем"""
+    store_dir = os.path.join(download_dir, STORE_DIRNAME)
+    os.makedirs(store_dir, exist_ok=True)
+    return os.path.join(store_dir, digest + extension)
+
+
+def find_stored_file(download_dir, digest, extension):
+    """Возвращает путь к уже сохраненному файлу с таким содержимым или None"""
+    store_path = get_store_path(download_dir, digest, extension)
+    if os.path.exists(store_path):
+        with _stats_lock:
+            _stats['reused'] += 1
+            _stats['bytes_saved'] += os.path.getsize(store_path)
+        return store_path
+    return None
+
+
+def get_temp_path(store_path):
+    """Уникальный временный путь рядом с файлом хранилища"""
+    return f"{store_path}.{uuid.uuid4().hex}.tmp"
+
+
+def commit_file(temp_path, store_path):
+    """Атомарно переносит записанный временный файл в хранилище"""
+    os.replace(temp_path, store_path)
+    with _stats_lock:
+        _stats['stored'] += 1
+    return store_path
+
+
+def discard_file(temp_path):
+    """Удаляет временный файл, если он остался"""
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
+def store_file(download_dir, digest, extension, write_file):
+    """
+    Сохраняет файл в хранилище: write_file(путь) записывает его во временный
+    файл, который затем атомарно переименовывается. Возвращает путь или None,
+    если write_file вернул False.
+    """
+    store_path = get_store_path(download_dir, digest, extension)
+    temp_path = get_temp_path(store_path)
+    try:
+        if write_file(temp_path) is False:
+            return None
+        return commit_file(temp_path, store_path)
+    finally:
+        discard_file(temp_path)
+
+
+def supports_hard_links(directory):
+    """Проверяет, можно ли создавать жесткие ссылки в директории"""
+    probe_path = os.path.join(directory, f".link_probe.{uuid.uuid4().hex}.tmp")
+    link_path = probe_path + '.link'
+    try:
+        open(probe_path, 'wb').close()
+        os.link(probe_path, link_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        for path in (probe_path, link_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def remove_unused_files(download_dir):
+    """
+    Удаляет файлы хранилища, на которые не ссылается ни один файл ячейки
+    (остались от изображений, изменившихся на сервере, или удаленных ячеек).
+    Если файловая система не поддерживает жесткие ссылки, ячейки хранятся
+    копиями и по числу ссылок ничего сказать нельзя — тогда ничего не удаляется.
+    Возвращает (количество удаленных файлов, освобождено байт).
+    """
+    store_dir = os.path.join(download_dir, STORE_DIRNAME)
+    if not os.path.isdir(store_dir) or not supports_hard_links(store_dir):
+        return 0, 0
+
+    removed_count = 0
+    removed_bytes = 0
+    for entry in os.scandir(store_dir):
+        if not entry.is_file() or entry.name.endswith('.tmp'):
+            continue
+        stat = entry.stat()
+        # Единственная ссылка на файл — сама запись хранилища
+        if stat.st_nlink == 1:
+            os.remove(entry.path)
+            removed_count += 1
+            removed_bytes += stat.st_size
+    return removed_count, removed_bytes
+
+
+def get_stats():
+    """Возвращает статистику хранилища за текущий запуск"""
+    with _stats_lock:
+        return dict(_stats)
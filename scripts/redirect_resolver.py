@@ -0,0 +1,105 @@
+"""
+Разрешение коротких ссылок (share.google, images.app.goo.gl, youtu.be и т.п.).
+Редиректы проходятся вручную запросами без тела, результат сохраняется
+в общем кэше, поэтому каждая короткая ссылка разрешается один раз за TTL
+и для парсинга, и для скачивания.
+"""
+
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+import url_cache
+from url_classifier import classify_url
+
+SHORT_LINK_HOSTS = {
+    'share.google', 'images.app.goo.gl', 'goo.gl', 'youtu.be',
+    'bit.ly', 't.co', 'tinyurl.com', 'clck.ru', 'vk.cc', 'ow.ly'
+}
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+MAX_REDIRECTS = 10
+
+
+def is_short_link(url):
+    """Проверяет, является ли ссылка короткой ссылкой-редиректом"""
+    return classify_url(url)['host'] in SHORT_LINK_HOSTS
+
+
+def rewrite_known_short_link(url):
+    """Разворачивает короткие ссылки, для которых не нужен запрос (youtu.be/ID)"""
+    parsed = urllib.parse.urlsplit(url)
+    if (parsed.hostname or '').lower() == 'youtu.be':
+        video_id = parsed.path.strip('/').split('/')[0]
+        if video_id:
+            query = urllib.parse.parse_qsl(parsed.query)
+            query.insert(0, ('v', video_id))
+            return 'https://www.youtube.com/watch?' + urllib.parse.urlencode(query)
+    return None
+
+
+def is_cacheable_status(status_code):
+    """
+    Окончательный ли ответ: 2xx, 3xx и 4xx, кроме 429. После 429 и 5xx
+    ссылка может разрешиться позже, поэтому такой результат не кэшируется.
+    """
+    return 200 <= status_code < 500 and status_code != 429
+
+
+def get_next_location(url):
+    """
+    Делает один запрос без тела.
+    Возвращает (адрес редиректа или None, код ответа).
+    """
+    response = http_client.head(url, allow_redirects=False, timeout=10)
+    if response.status_code in http_client.HEAD_UNSUPPORTED_STATUSES:
+        # Сервер не поддерживает HEAD: запрашиваем GET, но тело не читаем
+        response = http_client.get(url, allow_redirects=False, stream=True, timeout=10)
+        response.close()
+
+    location = response.headers.get('location')
+    if response.status_code in REDIRECT_STATUSES and location:
+        return urllib.parse.urljoin(url, location), response.status_code
+    return None, response.status_code
+
+
+def resolve_short_link(url):
+    """
+    Возвращает конечный адрес короткой ссылки.
+    Обычные ссылки и ссылки, которые не удалось разрешить, возвращаются как есть.
+    В кэш попадают только цепочки, закончившиеся окончательным ответом.
+    """
+    if not is_short_link(url):
+        return url
+
+    cached = url_cache.get_redirect(url)
+    if cached:
+        return cached
+
+    final_url = rewrite_known_short_link(url)
+    if final_url is None:
+        final_url = url
+        try:
+            for _ in range(MAX_REDIRECTS):
+                next_url, status_code = get_next_location(final_url)
+                if next_url is None:
+                    break
+                final_url = next_url
+        except Exception as e:
+            print(f"  ⚠️  Не удалось разрешить короткую ссылку {url}: {e}")
+            return url
+
+        if not is_cacheable_status(status_code):
+            # Временная ошибка (429, 5xx) — попробуем разрешить ссылку в следующий раз
+            print(f"  ⚠️  Не удалось разрешить короткую ссылку {url}: HTTP {status_code}")
+            return url
+
+    url_cache.save_redirect(url, final_url)
+    return final_url
+
+
+def resolve_short_links(urls, max_workers=8):
+    """Разрешает несколько ссылок параллельно, возвращает словарь {ссылка: конечный адрес}"""
+    unique_urls = list(dict.fromkeys(urls))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(unique_urls, executor.map(resolve_short_link, unique_urls)))
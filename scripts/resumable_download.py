@@ -0,0 +1,183 @@
+"""
+Скачивание с докачкой оборванных передач.
+Тело ответа читается в буфер в памяти. Если соединение обрывается посреди
+тела, полученные байты сохраняются в файл .part, а рядом в .part.json —
+валидаторы ответа (ETag/Last-Modified/Content-Length). Следующая попытка
+(в этом же или в следующем запуске) запрашивает только недостающую часть
+заголовком Range с If-Range, поэтому уже полученные данные не передаются повторно.
+Сколько раз и через какие паузы повторять оборванную передачу, решает
+вызывающий код (см. retry_policy.call_with_retry).
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import requests
+
+import http_client
+from retry_policy import raise_for_retryable_status
+
+PART_SUFFIX = '.part'
+PART_INFO_SUFFIX = '.json'
+
+# Ошибки, которые означают обрыв передачи тела, а не отказ сервера
+INTERRUPTED_ERRORS = (
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes\s+(\d+)-\d+/(\d+|\*)')
+
+
+def get_validators(response):
+    """
+    Возвращает валидаторы ответа, по которым можно безопасно докачать файл,
+    или None, если сервер не дает такой возможности
+    """
+    if response.headers.get('accept-ranges', '').lower() == 'none':
+        return None
+
+    etag = response.headers.get('etag')
+    if etag and etag.startswith('W/'):
+        # Слабый ETag нельзя использовать в If-Range
+        etag = None
+    last_modified = response.headers.get('last-modified')
+    if not etag and not last_modified:
+        return None
+
+    content_length = response.headers.get('content-length')
+    return {
+        'etag': etag,
+        'last_modified': last_modified,
+        'content_length': int(content_length) if content_length and content_length.isdigit() else None,
+    }
+
+
+def load_part_info(part_path, url):
+    """Возвращает сведения о недокачанном файле для url или None"""
+    try:
+        with open(part_path + PART_INFO_SUFFIX, 'r', encoding='utf-8') as f:
+            part_info = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+    if part_info.get('url') != url or not os.path.exists(part_path):
+        # Часть осталась от другой ссылки — докачивать нечего
+        remove_part(part_path)
+        return None
+    return part_info
+
+
+def save_part(buffer, part_path, part_info):
+    """Сохраняет полученные байты и валидаторы для докачки"""
+    buffer.seek(0)
+    with open(part_path, 'wb') as f:
+        shutil.copyfileobj(buffer, f)
+    with open(part_path + PART_INFO_SUFFIX, 'w', encoding='utf-8') as f:
+        json.dump(part_info, f, ensure_ascii=False)
+
+
+def remove_part(part_path):
+    """Удаляет файл .part и сведения о нем"""
+    for path in (part_path, part_path + PART_INFO_SUFFIX):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def get_resume_offset(response):
+    """Возвращает смещение начала ответа 206 из Content-Range или None"""
+    match = CONTENT_RANGE_PATTERN.match(response.headers.get('content-range', ''))
+    return int(match.group(1)) if match else None
+
+
+def download_to_buffer(url, part_path, spool_max_bytes, chunk_size, timeout=30, validators=None, limiter=None):
+    """
+    Скачивает url в буфер (SpooledTemporaryFile), продолжая ранее оборванную передачу.
+    Если переданы validators ({'etag', 'last_modified', 'digest'} прошлого ответа),
+    запрос делается условным (If-None-Match/If-Modified-Since).
+    Если передан limiter (BandwidthLimiter), скорость чтения тела ограничивается им.
+    При обрыве передачи полученные байты сохраняются в .part и исключение
+    пробрасывается, чтобы повторная попытка докачала файл. Временные ошибки
+    сервера (429, 503 и т.п.) пробрасываются как RetryableStatusError.
+
+    Returns:
+        tuple: (буфер, заголовки ответа, SHA-256 содержимого);
+               (None, заголовки ответа, validators['digest']), если сервер ответил 304;
+               (None, None, None) при ошибке. Буфер нужно закрыть после использования.
+    """
+    part_info = load_part_info(part_path, url)
+    offset = os.path.getsize(part_path) if part_info else 0
+
+    headers = {}
+    if offset:
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = part_info['etag'] or part_info['last_modified']
+    elif validators:
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+    response = http_client.get(url, headers=headers, timeout=timeout, stream=True)
+
+    if response.status_code == 304 and validators and not offset:
+        # Файл на сервере не изменился — тело не передается
+        response.close()
+        return None, response.headers, validators['digest']
+    elif response.status_code == 206 and offset and get_resume_offset(response) == offset:
+        print(f"  ↻ Докачиваю с {offset} байт")
+    elif response.status_code == 200:
+        # Сервер прислал файл целиком (файл изменился или Range не поддерживается)
+        offset = 0
+        part_info = get_validators(response)
+        if part_info:
+            part_info['url'] = url
+    else:
+        # Закрываем ответ, чтобы соединение вернулось в пул
+        response.close()
+        # Временная ошибка (429, 503): при повторе докачка продолжится с того же места
+        raise_for_retryable_status(response)
+        if offset:
+            # Сервер не продолжил передачу (416, 206 с другим Content-Range или
+            # неожиданный ответ) — недокачанная часть не годится, начинаем заново
+            remove_part(part_path)
+            return download_to_buffer(url, part_path, spool_max_bytes, chunk_size, timeout, validators, limiter)
+        print(f"  ❌ Ошибка HTTP: {response.status_code}")
+        return None, None, None
+
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    # SHA-256 содержимого считается по ходу скачивания
+    hasher = hashlib.sha256()
+    try:
+        if offset:
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    hasher.update(chunk)
+                    buffer.write(chunk)
+        for chunk in response.iter_content(chunk_size=chunk_size):
+            if chunk:
+                if limiter:
+                    limiter.consume(len(chunk))
+                hasher.update(chunk)
+                buffer.write(chunk)
+    except INTERRUPTED_ERRORS as e:
+        received = buffer.tell()
+        if part_info and received:
+            save_part(buffer, part_path, part_info)
+        buffer.close()
+        print(f"  ⚠️  Передача прервана на {received} байт: {e}")
+        raise
+    except Exception:
+        buffer.close()
+        raise
+    finally:
+        response.close()
+
+    remove_part(part_path)
+    buffer.seek(0)
+    return buffer, response.headers, hasher.hexdigest()
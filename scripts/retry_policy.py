@@ -0,0 +1,231 @@
+"""
+Повтор запросов после временных ошибок.
+Таймауты, обрывы соединения и ответы 408/425/429/5xx не считаются окончательной
+ошибкой: запрос повторяется с экспоненциальной задержкой со случайным разбросом,
+а если сервер прислал Retry-After — не раньше указанного им времени.
+Для каждого хоста ведется счетчик ошибок подряд (circuit breaker): после
+CIRCUIT_FAILURE_THRESHOLD ошибок хост считается недоступным на
+CIRCUIT_RESET_SECONDS, и запросы к нему сразу завершаются HostUnavailableError,
+не занимая потоки ожиданием таймаутов. По истечении этого времени к хосту
+пропускается один пробный запрос.
+
+Настройки (переменные окружения):
+    RETRY_MAX_ATTEMPTS         — попыток на один запрос (по умолчанию 4)
+    RETRY_BASE_DELAY_MS        — задержка перед первым повтором (по умолчанию 500)
+    RETRY_MAX_DELAY_MS         — максимальная задержка между попытками (по умолчанию 30000)
+    RETRY_AFTER_MAX_SECONDS    — дольше этого Retry-After не ждать (по умолчанию 120)
+    CIRCUIT_FAILURE_THRESHOLD  — ошибок подряд, после которых хост отключается (по умолчанию 5, 0 — не отключать)
+    CIRCUIT_RESET_SECONDS      — на сколько секунд отключается хост (по умолчанию 60)
+"""
+
+import email.utils
+import random
+import re
+import threading
+import time
+import urllib.parse
+
+import requests
+
+import http_client
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY_MS = 500
+DEFAULT_MAX_DELAY_MS = 30000
+DEFAULT_RETRY_AFTER_MAX_SECONDS = 120
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_SECONDS = 60
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+# Сетевые ошибки, после которых запрос имеет смысл повторить
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.Timeout,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+# Временные ошибки в тексте исключений yt-dlp
+RETRYABLE_MESSAGE_PATTERN = re.compile(
+    r'HTTP Error (?:408|425|429|500|502|503|504)\b'
+    r'|timed out|Connection reset|Connection refused|Connection aborted'
+    r'|Remote end closed|Temporary failure in name resolution',
+    re.IGNORECASE,
+)
+
+
+class RetryableError(Exception):
+    """Временная ошибка, после которой запрос стоит повторить"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RetryableStatusError(RetryableError):
+    """Сервер ответил кодом из RETRYABLE_STATUSES"""
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}", retry_after)
+        self.status_code = status_code
+
+
+class HostUnavailableError(Exception):
+    """Хост отключен после серии ошибок подряд"""
+
+    def __init__(self, host, retry_in):
+        super().__init__(f"хост {host} недоступен, следующая попытка через {retry_in:.0f} с")
+        self.host = host
+        self.retry_in = retry_in
+
+
+def get_host(url):
+    """Хост url в нижнем регистре — ключ счетчиков circuit breaker'а"""
+    return (urllib.parse.urlsplit(url).hostname or '').lower()
+
+
+def parse_retry_after(value):
+    """Возвращает задержку из заголовка Retry-After в секундах или None"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def raise_for_retryable_status(response):
+    """Бросает RetryableStatusError, если ответ сервера — временная ошибка"""
+    if response.status_code in RETRYABLE_STATUSES:
+        raise RetryableStatusError(response.status_code,
+                                   parse_retry_after(response.headers.get('retry-after')))
+
+
+def is_retryable_message(error):
+    """Проверяет по тексту исключения (например, DownloadError yt-dlp), временная ли это ошибка"""
+    return bool(RETRYABLE_MESSAGE_PATTERN.search(str(error)))
+
+
+def get_backoff_delay(attempt):
+    """Задержка перед повтором номер attempt: случайная в пределах base * 2^(attempt-1)"""
+    base_delay = max(0, http_client.get_int_setting('RETRY_BASE_DELAY_MS', DEFAULT_BASE_DELAY_MS)) / 1000
+    max_delay = max(0, http_client.get_int_setting('RETRY_MAX_DELAY_MS', DEFAULT_MAX_DELAY_MS)) / 1000
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """Счетчик ошибок подряд для каждого хоста и время, до которого хост отключен"""
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = max(0, failure_threshold)
+        self.reset_seconds = max(0.0, reset_seconds)
+        self.lock = threading.Lock()
+        self.failures = {}
+        self.open_until = {}
+        self.probing = set()
+
+    def check(self, host):
+        """
+        Бросает HostUnavailableError, если запросы к хосту сейчас не пропускаются.
+        Возвращает True, если запрос пропущен как пробный — тогда после него
+        нужно вызвать record_success, record_failure или end_probe.
+        """
+        with self.lock:
+            open_until = self.open_until.get(host)
+            if open_until is None:
+                return False
+            now = time.monotonic()
+            if now < open_until or host in self.probing:
+                raise HostUnavailableError(host, max(0.0, open_until - now))
+            # Время отключения вышло — пропускаем один пробный запрос
+            self.probing.add(host)
+            return True
+
+    def end_probe(self, host):
+        """Снимает отметку пробного запроса, не меняя состояние хоста"""
+        with self.lock:
+            self.probing.discard(host)
+
+    def record_success(self, host):
+        with self.lock:
+            self.failures.pop(host, None)
+            self.open_until.pop(host, None)
+            self.probing.discard(host)
+
+    def record_failure(self, host):
+        """Учитывает ошибку; возвращает True, если хост только что отключен"""
+        if not self.failure_threshold:
+            return False
+        with self.lock:
+            failures = self.failures.get(host, 0) + 1
+            self.failures[host] = failures
+            if host in self.probing or (failures >= self.failure_threshold and host not in self.open_until):
+                self.probing.discard(host)
+                self.open_until[host] = time.monotonic() + self.reset_seconds
+                return True
+        return False
+
+
+_circuit_breaker = None
+_circuit_breaker_lock = threading.Lock()
+
+
+def get_circuit_breaker():
+    """
+    Возвращает общий для всех потоков CircuitBreaker.
+    Порог и время отключения берутся из CIRCUIT_FAILURE_THRESHOLD и CIRCUIT_RESET_SECONDS.
+    """
+    global _circuit_breaker
+    with _circuit_breaker_lock:
+        if _circuit_breaker is None:
+            _circuit_breaker = CircuitBreaker(
+                http_client.get_int_setting('CIRCUIT_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD),
+                http_client.get_int_setting('CIRCUIT_RESET_SECONDS', DEFAULT_RESET_SECONDS),
+            )
+    return _circuit_breaker
+
+
+def call_with_retry(func, url, is_retryable=None):
+    """
+    Вызывает func() и повторяет вызов после временных ошибок запроса к url.
+    Временными считаются RETRYABLE_EXCEPTIONS, RetryableError и исключения,
+    для которых is_retryable(исключение) вернул True. Остальные исключения
+    пробрасываются сразу. После последней попытки пробрасывается последняя ошибка.
+    Если хост отключен circuit breaker'ом, бросает HostUnavailableError.
+    """
+    host = get_host(url)
+    breaker = get_circuit_breaker()
+    attempts = max(1, http_client.get_int_setting('RETRY_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+    retry_after_max = http_client.get_int_setting('RETRY_AFTER_MAX_SECONDS', DEFAULT_RETRY_AFTER_MAX_SECONDS)
+
+    for attempt in range(1, attempts + 1):
+        probe = breaker.check(host)
+        try:
+            result = func()
+        except BaseException as e:
+            if not isinstance(e, RETRYABLE_EXCEPTIONS + (RetryableError,)) and not (is_retryable and is_retryable(e)):
+                # Ошибка не говорит о недоступности хоста (например, видео удалено) —
+                # пробный запрос завершен, следующий запрос к хосту снова будет пробным
+                if probe:
+                    breaker.end_probe(host)
+                raise
+            if breaker.record_failure(host):
+                # Хост отключен — дальнейшие попытки все равно не пройдут
+                print(f"  ⚠️  Хост {host} отключен на {breaker.reset_seconds:.0f} с после ошибок подряд")
+                raise
+            retry_after = getattr(e, 'retry_after', None)
+            if attempt == attempts or (retry_after is not None and retry_after > retry_after_max):
+                raise
+            delay = retry_after if retry_after is not None else get_backoff_delay(attempt)
+            print(f"  ↻ Повтор через {delay:.1f} с (попытка {attempt + 1}/{attempts}): {e}")
+            time.sleep(delay)
+        else:
+            breaker.record_success(host)
+            return result
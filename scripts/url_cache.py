@@ -0,0 +1,259 @@
+"""
+Постоянный кэш результатов проверки ссылок.
+Хранится в SQLite-файле в ~/Downloads/download_all/ и общий для всех проектов.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+import http_client
+
+DEFAULT_TTL_HOURS = 168  # Неделя
+DEFAULT_MAX_ENTRIES = 200000
+
+_connection = None
+_connection_lock = threading.Lock()
+
+
+def get_cache_path():
+    """Возвращает путь к файлу кэша"""
+    download_all_dir = os.path.join(os.path.expanduser('~/Downloads'), 'download_all')
+    return os.path.join(download_all_dir, 'url_cache.sqlite3')
+
+
+def get_ttl_seconds():
+    """Время жизни записи кэша в секундах (URL_CACHE_TTL_HOURS)"""
+    return http_client.get_int_setting('URL_CACHE_TTL_HOURS', DEFAULT_TTL_HOURS) * 3600
+
+
+def get_max_entries():
+    """Максимальное количество записей в кэше (URL_CACHE_MAX_ENTRIES)"""
+    return http_client.get_int_setting('URL_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+
+
+def normalize_url(url):
+    """Приводит URL к единому виду для использования в качестве ключа кэша"""
+    parsed = urllib.parse.urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+
+    # Убираем порт по умолчанию
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+
+    path = parsed.path or '/'
+    # Фрагмент (#...) не отправляется на сервер, поэтому отбрасываем его
+    return urllib.parse.urlunsplit((scheme, netloc, path, parsed.query, ''))
+
+
+def get_connection():
+    """Открывает (при первом обращении) соединение с базой кэша"""
+    global _connection
+    if _connection is None:
+        cache_path = get_cache_path()
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        _connection = sqlite3.connect(cache_path, check_same_thread=False)
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS url_classification (
+                url TEXT PRIMARY KEY,
+                category TEXT,
+                content_type TEXT,
+                final_url TEXT,
+                sniffed_type TEXT,
+                checked_at REAL NOT NULL
+            )
+        """)
+        # Базы, созданные до появления определения типа по сигнатуре
+        columns = [row[1] for row in _connection.execute("PRAGMA table_info(url_classification)")]
+        if 'sniffed_type' not in columns:
+            _connection.execute("ALTER TABLE url_classification ADD COLUMN sniffed_type TEXT")
+        _connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_url_classification_checked_at "
+            "ON url_classification (checked_at)"
+        )
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS redirects (
+                url TEXT PRIMARY KEY,
+                final_url TEXT NOT NULL,
+                checked_at REAL NOT NULL
+            )
+        """)
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS http_validators (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                digest TEXT,
+                checked_at REAL NOT NULL
+            )
+        """)
+        _connection.commit()
+    return _connection
+
+
+def get_classification(url):
+    """
+    Возвращает сохраненный результат проверки URL или None,
+    если записи нет или срок ее жизни истек
+    """
+    key = normalize_url(url)
+    min_checked_at = time.time() - get_ttl_seconds()
+
+    with _connection_lock:
+        try:
+            row = get_connection().execute(
+                "SELECT category, content_type, final_url, sniffed_type FROM url_classification "
+                "WHERE url = ? AND checked_at >= ?",
+                (key, min_checked_at)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка чтения кэша ссылок: {e}")
+            return None
+
+    if row is None:
+        return None
+
+    return {
+        'category': row[0],
+        'content_type': row[1],
+        'final_url': row[2],
+        'sniffed_type': row[3]
+    }
+
+
+def save_classification(url, category, content_type=None, final_url=None, sniffed_type=None):
+    """
+    Сохраняет результат проверки URL в кэш.
+    sniffed_type — MIME-тип, определенный по первым байтам файла, если проверялся.
+    """
+    key = normalize_url(url)
+
+    with _connection_lock:
+        try:
+            connection = get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO url_classification "
+                "(url, category, content_type, final_url, sniffed_type, checked_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, category, content_type, final_url, sniffed_type, time.time())
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка записи в кэш ссылок: {e}")
+
+
+def get_redirect(url):
+    """Возвращает сохраненный конечный адрес короткой ссылки или None"""
+    key = normalize_url(url)
+    min_checked_at = time.time() - get_ttl_seconds()
+
+    with _connection_lock:
+        try:
+            row = get_connection().execute(
+                "SELECT final_url FROM redirects WHERE url = ? AND checked_at >= ?",
+                (key, min_checked_at)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка чтения кэша ссылок: {e}")
+            return None
+
+    return row[0] if row else None
+
+
+def save_redirect(url, final_url):
+    """Сохраняет конечный адрес короткой ссылки"""
+    key = normalize_url(url)
+
+    with _connection_lock:
+        try:
+            connection = get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO redirects (url, final_url, checked_at) VALUES (?, ?, ?)",
+                (key, final_url, time.time())
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка записи в кэш ссылок: {e}")
+
+
+def get_http_validators(url):
+    """
+    Возвращает сохраненные валидаторы ответа для условного запроса:
+    {'etag', 'last_modified', 'digest'} или None
+    """
+    key = normalize_url(url)
+    min_checked_at = time.time() - get_ttl_seconds()
+
+    with _connection_lock:
+        try:
+            row = get_connection().execute(
+                "SELECT etag, last_modified, digest FROM http_validators WHERE url = ? AND checked_at >= ?",
+                (key, min_checked_at)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка чтения кэша ссылок: {e}")
+            return None
+
+    if row is None:
+        return None
+
+    return {
+        'etag': row[0],
+        'last_modified': row[1],
+        'digest': row[2]
+    }
+
+
+def save_http_validators(url, etag, last_modified, digest):
+    """
+    Сохраняет ETag/Last-Modified ответа и SHA-256 полученного содержимого.
+    Ответы без валидаторов не сохраняются: условный запрос для них невозможен.
+    """
+    if not etag and not last_modified:
+        return
+    key = normalize_url(url)
+
+    with _connection_lock:
+        try:
+            connection = get_connection()
+            connection.execute(
+                "INSERT OR REPLACE INTO http_validators (url, etag, last_modified, digest, checked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, etag, last_modified, digest, time.time())
+            )
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка записи в кэш ссылок: {e}")
+
+
+def evict_expired():
+    """Удаляет устаревшие записи и самые старые записи сверх лимита"""
+    min_checked_at = time.time() - get_ttl_seconds()
+    max_entries = get_max_entries()
+
+    with _connection_lock:
+        try:
+            connection = get_connection()
+            removed = 0
+            for table in ('url_classification', 'redirects', 'http_validators'):
+                removed += connection.execute(
+                    f"DELETE FROM {table} WHERE checked_at < ?",
+                    (min_checked_at,)
+                ).rowcount
+
+                # Если записей больше лимита, удаляем самые давние
+                removed += connection.execute(
+                    f"DELETE FROM {table} WHERE url IN ("
+                    f"SELECT url FROM {table} ORDER BY checked_at DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (max_entries,)
+                ).rowcount
+            connection.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️  Ошибка очистки кэша ссылок: {e}")
+            return 0
+
+    return removed
@@ -0,0 +1,212 @@
+"""
+Общий классификатор ссылок для всех скриптов.
+Хост разбирается один раз и ищется в заранее построенном индексе доменов
+по суффиксам (www.vk.com -> vk.com), поэтому x.com не совпадает с dropbox.com.
+"""
+
+import re
+import sys
+import time
+
+# Домены: (домен, категория для парсинга ссылок, название платформы)
+# Категория None означает, что тип контента определяется по заголовкам
+DOMAIN_RULES = [
+    # YouTube
+    ('youtube.com', 'youtube', 'YouTube'),
+    ('youtu.be', 'youtube', 'YouTube'),
+
+    # Хостинги изображений
+    ('images.app.goo.gl', 'image', None),
+    ('share.google', 'image', None),
+    ('avatars.mds.yandex.net', 'image', None),
+    ('avatars.dzeninfra.ru', 'image', None),
+    ('cdn.i.haymarketmedia.asia', 'image', None),
+    ('images.steamusercontent.com', 'image', None),
+    ('play-lh.googleusercontent.com', 'image', None),
+
+    # Основные видео платформы
+    ('vimeo.com', 'video', 'Vimeo'),
+    ('dailymotion.com', 'video', 'Dailymotion'),
+    ('twitch.tv', None, 'Twitch'),
+    ('facebook.com', 'video', 'Facebook'),
+    ('instagram.com', 'video', 'Instagram'),
+    ('tiktok.com', 'video', 'TikTok'),
+    ('reddit.com', None, 'Reddit'),
+    ('twitter.com', None, 'Twitter/X'),
+    ('x.com', None, 'Twitter/X'),
+    ('bilibili.com', 'video', 'Bilibili'),
+
+    # Дополнительные платформы
+    ('rutube.ru', 'video', 'Rutube'),
+    ('vk.com', None, 'VKontakte'),
+    ('ok.ru', 'video', 'Odnoklassniki'),
+    ('mail.ru', None, 'Mail.ru'),
+    ('yandex.ru', None, 'Yandex'),
+    ('pinterest.com', None, 'Pinterest'),
+    ('linkedin.com', None, 'LinkedIn'),
+    ('snapchat.com', None, 'Snapchat'),
+    ('telegram.org', None, 'Telegram'),
+    ('discord.com', None, 'Discord'),
+    ('zoom.us', None, 'Zoom'),
+    ('teams.microsoft.com', None, 'Microsoft Teams'),
+    ('webex.com', None, 'Cisco Webex'),
+
+    # Стриминговые платформы
+    ('kick.com', None, 'Kick'),
+    ('rumble.com', None, 'Rumble'),
+    ('odysee.com', None, 'Odysee'),
+    ('lbry.tv', None, 'LBRY'),
+    ('peertube.fr', None, 'PeerTube'),
+    ('peertube.org', None, 'PeerTube'),
+    ('invidious.io', None, 'Invidious'),
+    ('invidious.snopyta.org', None, 'Invidious'),
+
+    # Азиатские платформы
+    ('nicovideo.jp', None, 'Niconico'),
+    ('niconico.jp', None, 'Niconico'),
+    ('youku.com', None, 'Youku'),
+    ('iqiyi.com', None, 'iQiyi'),
+    ('tencent.com', None, 'Tencent'),
+    ('qq.com', None, 'QQ'),
+    ('weibo.com', None, 'Weibo'),
+    ('douyin.com', None, 'Douyin'),
+
+    # Российские платформы
+    ('dzen.ru', 'video', 'Dzen'),
+    ('megabook.ru', None, 'Megabook'),
+]
+
+# Уточнения по пути: (домен, регулярное выражение для пути, категория, платформа)
+# None в категории или платформе означает "взять значение домена"
+PATH_RULES = [
+    ('vk.com', r'^/video', 'video', None),
+    ('yandex.ru', r'^/video', 'video', 'Yandex Video'),
+    ('megabook.ru', r'^/stream', None, 'Megabook Video'),
+    ('dzen.ru', r'video|media', None, 'Dzen Video'),
+]
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tiff', '.svg')
+VIDEO_EXTENSIONS = ('.mp4', '.webm', '.mov', '.avi', '.mkv', '.flv', '.m4v', '.3gp')
+
+# Параметры в URL, указывающие на изображения
+IMAGE_URL_MARKERS = re.compile(r'scale_|resize|XXXL|diploma|thumbs')
+
+# Схема, хост, путь и параметры URL (быстрее, чем urllib.parse.urlsplit)
+URL_PARTS_PATTERN = re.compile(r'^[a-zA-Z][a-zA-Z0-9+.-]*://(?:[^@/?#]*@)?([^:/?#]*)(?::\d*)?([^?#]*)(?:\?([^#]*))?')
+
+UNKNOWN_PLATFORM = 'Unknown Platform'
+
+
+def build_domain_index(domain_rules, path_rules):
+    """Строит индекс {домен: (категория, платформа, [правила пути])}"""
+    index = {}
+    for domain, category, platform in domain_rules:
+        index[domain] = (category, platform, [])
+
+    for domain, pattern, category, platform in path_rules:
+        index[domain][2].append((re.compile(pattern), category, platform))
+
+    return index
+
+
+DOMAIN_INDEX = build_domain_index(DOMAIN_RULES, PATH_RULES)
+
+
+def lookup_host(host):
+    """Ищет самый длинный совпадающий суффикс хоста в индексе доменов"""
+    labels = host.split('.')
+    for i in range(len(labels) - 1):
+        entry = DOMAIN_INDEX.get('.'.join(labels[i:]))
+        if entry is not None:
+            return entry
+    return None
+
+
+def classify_url(url):
+    """
+    Классифицирует ссылку за один разбор URL.
+
+    Returns:
+        dict: {'host', 'category', 'platform'}, где category — 'youtube',
+        'image', 'video' или None (нужна проверка по заголовкам),
+        а platform — название видео платформы или None
+    """
+    match = URL_PARTS_PATTERN.match(url)
+    if match is None:
+        return {'host': '', 'category': None, 'platform': None}
+
+    host = match.group(1).lower().rstrip('.')
+    raw_path = match.group(2)
+    query = match.group(3)
+    path = raw_path.lower()
+    host_category = None
+    platform = None
+
+    entry = lookup_host(host)
+    if entry is not None:
+        host_category, platform, host_path_rules = entry
+        rest = raw_path + ('?' + query if query else '')
+        for pattern, rule_category, rule_platform in host_path_rules:
+            if pattern.search(rest):
+                host_category = rule_category or host_category
+                platform = rule_platform or platform
+                break
+
+    # Порядок проверок: YouTube, изображения, затем видео
+    if host_category in ('youtube', 'image'):
+        category = host_category
+    elif path.endswith(IMAGE_EXTENSIONS) or IMAGE_URL_MARKERS.search(url):
+        category = 'image'
+    elif host_category == 'video' or path.endswith(VIDEO_EXTENSIONS):
+        category = 'video'
+    else:
+        category = None
+
+    return {'host': host, 'category': category, 'platform': platform}
+
+
+def legacy_classify_url(url):
+    """Прежняя классификация подстроками — используется только в бенчмарке"""
+    if 'youtube.com' in url or 'youtu.be' in url:
+        return 'youtube'
+    for domain, category, _ in DOMAIN_RULES:
+        if category == 'image' and domain in url:
+            return 'image'
+    if any(url.lower().split('?')[0].endswith(ext) for ext in IMAGE_EXTENSIONS):
+        return 'image'
+    for param in ['scale_', 'resize', 'XXXL', 'diploma', 'thumbs']:
+        if param in url:
+            return 'image'
+    for domain, _, _ in DOMAIN_RULES:
+        if domain in url:
+            return 'video'
+    if any(url.lower().split('?')[0].endswith(ext) for ext in VIDEO_EXTENSIONS):
+        return 'video'
+    return None
+
+
+def run_benchmark(count=1000000):
+    """Сравнивает скорость индекса доменов с прежним перебором подстрок"""
+    sample_urls = [
+        'https://www.youtube.com/watch?v=dQw4w9WgXcQ',
+        'https://vimeo.com/123456789',
+        'https://avatars.mds.yandex.net/get-entity_search/123/orig',
+        'https://example.com/some/article/page.html?utm_source=sheet',
+        'https://www.dropbox.com/s/abc/file.pdf?dl=0',
+        'https://cdn.example.org/images/photo.JPG',
+        'https://m.vk.com/video-123_456',
+        'https://news.site.ru/2024/01/01/story',
+    ]
+    urls = [sample_urls[i % len(sample_urls)] for i in range(count)]
+
+    print(f"=== БЕНЧМАРК КЛАССИФИКАЦИИ ({count} ссылок) ===")
+    for name, function in [('Перебор подстрок', legacy_classify_url), ('Индекс доменов', classify_url)]:
+        start = time.perf_counter()
+        for url in urls:
+            function(url)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {elapsed:.2f} с ({count / elapsed:,.0f} ссылок/с)")
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)